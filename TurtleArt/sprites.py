@@ -82,6 +82,13 @@ import gtk
 import pango
 import pangocairo
 import cairo
+from bisect import bisect_left, bisect_right
+
+# Size in pixels of the cells of the grid used to find the sprites at a
+# position or in an area
+_CELL_SIZE = 128
+# Number of label widths remembered by Sprites.measure_label
+_MAX_LABEL_WIDTHS = 4096
 
 
 class Sprites:
@@ -91,9 +98,17 @@ class Sprites:
     def __init__(self, widget):
         ''' Initialize an empty array of sprites '''
         self.widget = widget
-        self.list = []
+        self.list = []  # sorted by layer, in drawing order
+        self._keys = []  # (layer, sequence) sort key of each sprite in list
+        self._members = {}  # sprite: sort key
+        self._sequence = 0
+        self._cells = {}  # (column, row): set of sprites overlapping it
+        self._sprite_cells = {}  # sprite: cells it is in
+        self.update_cb = None  # called with each sprite moved or resized
         self.cr = None
         self.defer_draw = False
+        self._layout = None  # pango layout shared for measuring labels
+        self._label_widths = {}  # (text, font): width
 
     def set_defer_draw(self, state):
         self.defer_draw = state
@@ -101,6 +116,25 @@ class Sprites:
     def set_cairo_context(self, cr):
         ''' Cairo context may be set or reset after __init__ '''
         self.cr = cr
+        self._layout = None
+        self._label_widths = {}
+
+    def measure_label(self, text, fd, size):
+        ''' The width of text in font fd at size, measured with a single
+        pango layout and remembered, since many blocks share a label '''
+        fd.set_size(int(size * pango.SCALE))
+        key = (text, fd.to_string())
+        width = self._label_widths.get(key)
+        if width is None:
+            if self._layout is None:
+                self._layout = pangocairo.CairoContext(self.cr).create_layout()
+            self._layout.set_text(text)
+            self._layout.set_font_description(fd)
+            width = self._layout.get_size()[0] / pango.SCALE
+            if len(self._label_widths) >= _MAX_LABEL_WIDTHS:
+                self._label_widths = {}
+            self._label_widths[key] = width
+        return width
 
     def get_sprite(self, i):
         ''' Return a sprint from the array '''
@@ -113,32 +147,149 @@ class Sprites:
         ''' How many sprites are there? '''
         return len(self.list)
 
+    def _next_key(self, layer):
+        self._sequence += 1
+        return (layer, self._sequence)
+
     def append_to_list(self, spr):
         ''' Append a new sprite to the end of the list. '''
+        if spr in self._members:
+            self.remove_from_list(spr)
+        # The sprite is drawn on top until its layer is set, so it sorts
+        # with the topmost layer.
+        layer = spr.layer
+        if self._keys and self._keys[-1][0] > layer:
+            layer = self._keys[-1][0]
+        key = self._next_key(layer)
         self.list.append(spr)
+        self._keys.append(key)
+        self._members[spr] = key
+        self._add_to_grid(spr)
+
+    def insert_by_layer(self, spr):
+        ''' Insert a sprite above all the sprites in the same or lower
+        layers. '''
+        if spr in self._members:
+            self.remove_from_list(spr)
+        key = self._next_key(spr.layer)
+        i = bisect_right(self._keys, key)
+        self.list.insert(i, spr)
+        self._keys.insert(i, key)
+        self._members[spr] = key
+        self._add_to_grid(spr)
+
+    def set_layers(self, sprites, layer):
+        ''' Move sprites to a layer, in order, as set_layer would one by one
+        but with a single pass over the list. '''
+        moved = set(sprites)
+        if not moved:
+            return
+        list_ = []
+        keys = []
+        for spr, key in zip(self.list, self._keys):
+            if spr not in moved:
+                list_.append(spr)
+                keys.append(key)
+        chunk = []
+        chunk_keys = []
+        for spr in sprites:
+            if spr not in moved:
+                continue  # listed twice
+            moved.discard(spr)
+            spr.layer = layer
+            key = self._next_key(layer)
+            if spr not in self._members:
+                self._add_to_grid(spr)
+            self._members[spr] = key
+            chunk.append(spr)
+            chunk_keys.append(key)
+        i = bisect_right(keys, chunk_keys[0])
+        self.list = list_[:i] + chunk + list_[i:]
+        self._keys = keys[:i] + chunk_keys + keys[i:]
+        for spr in chunk:
+            spr.inval()
 
     def insert_in_list(self, spr, i):
         ''' Insert a sprite at position i. '''
+        if spr in self._members:
+            self.remove_from_list(spr)
         if i < 0:
             self.list.insert(0, spr)
         elif i > len(self.list) - 1:
             self.list.append(spr)
         else:
             self.list.insert(i, spr)
+        # Position may be out of layer order: recompute all the keys
+        self._keys = []
+        self._members = {}
+        layer = None
+        for sprite in self.list:
+            if layer is None or sprite.layer > layer:
+                layer = sprite.layer
+            key = self._next_key(layer)
+            self._keys.append(key)
+            self._members[sprite] = key
+        self._add_to_grid(spr)
 
     def find_in_list(self, spr):
-        return (spr in self.list)
+        return (spr in self._members)
 
     def remove_from_list(self, spr):
         ''' Remove a sprite from the list. '''
-        if spr in self.list:
-            self.list.remove(spr)
+        key = self._members.pop(spr, None)
+        if key is None:
+            return
+        i = bisect_left(self._keys, key)
+        del self._keys[i]
+        del self.list[i]
+        self._remove_from_grid(spr)
+
+    def _get_cells(self, rect):
+        ''' The grid cells overlapping a rectangle (including its right
+        and bottom edges, as Sprite.hit does) '''
+        column0 = rect.x // _CELL_SIZE
+        row0 = rect.y // _CELL_SIZE
+        column1 = (rect.x + rect.width) // _CELL_SIZE
+        row1 = (rect.y + rect.height) // _CELL_SIZE
+        return [(column, row) for column in range(column0, column1 + 1)
+                for row in range(row0, row1 + 1)]
+
+    def _add_to_grid(self, spr):
+        cells = self._get_cells(spr.rect)
+        for cell in cells:
+            if cell in self._cells:
+                self._cells[cell].add(spr)
+            else:
+                self._cells[cell] = set([spr])
+        self._sprite_cells[spr] = cells
+
+    def _remove_from_grid(self, spr):
+        for cell in self._sprite_cells.pop(spr, []):
+            sprites = self._cells[cell]
+            sprites.discard(spr)
+            if not sprites:
+                del self._cells[cell]
+
+    def update_grid(self, spr):
+        ''' The sprite has moved or changed size '''
+        if self.update_cb is not None:
+            self.update_cb(spr)
+        if spr in self._members:
+            self._remove_from_grid(spr)
+            self._add_to_grid(spr)
+
+    def _sprites_in(self, cells):
+        ''' The sprites in the cells, in drawing order '''
+        sprites = set()
+        for cell in cells:
+            if cell in self._cells:
+                sprites.update(self._cells[cell])
+        return sorted(sprites, key=self._members.get)
 
     def find_sprite(self, pos, region=False):
         ''' Search based on (x, y) position. Return the 'top/first' one. '''
-        list = self.list[:]
-        list.reverse()
-        for spr in list:
+        cell = (int(pos[0]) // _CELL_SIZE, int(pos[1]) // _CELL_SIZE)
+        for spr in reversed(self._sprites_in([cell])):
             if spr.hit(pos, readpixel=not region):
                 return spr
         return None
@@ -154,13 +305,14 @@ class Sprites:
         if cr is None:
             print 'sprites.redraw_sprites: no Cairo context'
             return
-        for spr in self.list:
-            if area is None:
+        if area is None:
+            for spr in self.list:
+                spr.draw(cr=cr)
+            return
+        for spr in self._sprites_in(self._get_cells(area)):
+            intersection = spr.rect.intersect(area)
+            if intersection.width > 0 or intersection.height > 0:
                 spr.draw(cr=cr)
-            else:
-                intersection = spr.rect.intersect(area)
-                if intersection.width > 0 or intersection.height > 0:
-                    spr.draw(cr=cr)
 
 
 class Sprite:
@@ -186,6 +338,7 @@ class Sprite:
         self.layer = 100
         self.labels = []
         self.cached_surfaces = []
+        self._pixels = []  # pixel data of the surfaces, read by get_pixel
         self._dx = []  # image offsets
         self._dy = []
         self.type = None
@@ -196,6 +349,7 @@ class Sprite:
         ''' Add an image to the sprite. '''
         while len(self.cached_surfaces) < i + 1:
             self.cached_surfaces.append(None)
+            self._pixels.append(None)
             self._dx.append(0)
             self._dy.append(0)
         self._dx[i] = dx
@@ -225,19 +379,26 @@ class Sprite:
             context.rectangle(0, 0, self.rect.width, self.rect.height)
             context.fill()
             self.cached_surfaces[i] = surface
+        self._pixels[i] = None
+        self._sprites.update_grid(self)
 
     def move(self, pos):
         ''' Move to new (x, y) position '''
         self.inval()
         self.rect.x, self.rect.y = int(pos[0]), int(pos[1])
+        self._sprites.update_grid(self)
         self.inval()
 
-    def move_relative(self, pos):
-        ''' Move to new (x+dx, y+dy) position '''
-        self.inval()
+    def move_relative(self, pos, invalidate=True):
+        ''' Move to new (x+dx, y+dy) position; the caller can invalidate
+        the area itself when moving many sprites at once. '''
+        if invalidate:
+            self.inval()
         self.rect.x += int(pos[0])
         self.rect.y += int(pos[1])
-        self.inval()
+        self._sprites.update_grid(self)
+        if invalidate:
+            self.inval()
 
     def get_xy(self):
         ''' Return current (x, y) position '''
@@ -262,13 +423,7 @@ class Sprite:
         self._sprites.remove_from_list(self)
         if layer is not None:
             self.layer = layer
-        for i in range(self._sprites.length_of_list()):
-            spr = self._sprites.get_sprite(i)
-            if spr is not None and self.layer < spr.layer:
-                self._sprites.insert_in_list(self, i)
-                self.inval()
-                return
-        self._sprites.append_to_list(self)
+        self._sprites.insert_by_layer(self)
         self.inval()
 
     def set_label(self, new_label, i=0):
@@ -441,15 +596,11 @@ class Sprite:
 
     def label_width(self):
         ''' Calculate the width of a label '''
-        cr = pangocairo.CairoContext(self._sprites.cr)
-        if cr is not None:
+        if self._sprites.cr is not None:
             max = 0
             for i in range(len(self.labels)):
-                pl = cr.create_layout()
-                pl.set_text(self.labels[i])
-                self._fd.set_size(int(self._scale[i] * pango.SCALE))
-                pl.set_font_description(self._fd)
-                w = pl.get_size()[0] / pango.SCALE
+                w = self._sprites.measure_label(self.labels[i], self._fd,
+                                                self._scale[i])
                 if w > max:
                     max = w
             return max
@@ -475,6 +626,20 @@ class Sprite:
         if x < 0 or x > (self.rect.width - 1) or \
                 y < 0 or y > (self.rect.height - 1):
             return(-1, -1, -1, -1)
+        surface = self.cached_surfaces[i]
+        if surface.get_format() in (cairo.FORMAT_ARGB32, cairo.FORMAT_RGB24):
+            # Read the pixel straight from a copy of the image data,
+            # made once per image, rather than painting it each time.
+            if self._pixels[i] is None:
+                surface.flush()
+                self._pixels[i] = (str(surface.get_data()),
+                                   surface.get_stride())
+            pixels, stride = self._pixels[i]
+            if x >= surface.get_width() or y >= surface.get_height():
+                return (0, 0, 0, 0)
+            offset = y * stride + x * 4
+            return (ord(pixels[offset + 2]), ord(pixels[offset + 1]),
+                    ord(pixels[offset]), 0)
         # Create a new 1x1 cairo surface.
         cs = cairo.ImageSurface(cairo.FORMAT_RGB24, 1, 1)
         cr = cairo.Context(cs)
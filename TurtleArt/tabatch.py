@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' Headless batch renderer: run many projects and save their output '''
+
+import cairo
+import errno
+import getopt
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+
+from TurtleArt.tautils import (find_start_stack, find_block_to_run,
+                               find_top_block, save_picture)
+from TurtleArt.talogo import MAX_STACK_DEPTH
+from TurtleArt.tawindow import TurtleArtWindow
+
+_PROJECT_SUFFIXES = ('.ta', '.tb', '.tbz')
+_DEFAULT_WIDTH = 1024
+_DEFAULT_HEIGHT = 768
+_DEFAULT_TIMEOUT = 60  # seconds
+
+_HELP_MSG = '''turtleblocks-batch: usage is
+ \tturtleblocks-batch [options] project.tb|directory ...
+ \t-o, --output_dir=DIR   directory for the images (default: .); an
+ \t                       image is named after the project's path in the
+ \t                       directory it was found in, e.g. class1/foo.tb.png
+ \t-W, --width=PIXELS     canvas width (default: %d)
+ \t-H, --height=PIXELS    canvas height (default: %d)
+ \t-t, --timeout=SECONDS  maximum run time per project (default: %d)
+ \t-j, --jobs=N           number of worker processes (default: CPU count)
+ \t-s, --svg              also save an SVG image
+ \t-c, --compiled         run the projects in compiled mode
+ \t-d, --max_depth=N      most action stacks running inside each other
+ \t                       before a #stackoverflow error (default: %d)''' % (
+    _DEFAULT_WIDTH, _DEFAULT_HEIGHT, _DEFAULT_TIMEOUT, MAX_STACK_DEPTH)
+
+
+class ProjectTimeout(Exception):
+    ''' Raised when a project runs longer than its time limit '''
+    pass
+
+
+class ProjectError(Exception):
+    ''' Raised when a project stops with an error in one of its blocks '''
+    pass
+
+
+def _alarm_cb(signum, frame):
+    raise ProjectTimeout()
+
+
+def _walk_projects(paths):
+    ''' Yield (project file, path relative to the directory given) for a
+    list of files and directories '''
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if os.path.splitext(name)[1] in _PROJECT_SUFFIXES:
+                        ta_file = os.path.join(dirpath, name)
+                        yield ta_file, os.path.relpath(ta_file, path)
+        elif os.path.exists(path):
+            yield path, os.path.basename(path)
+
+
+def find_projects(paths):
+    ''' Expand a list of files and directories into project files '''
+    return [ta_file for ta_file, name in _walk_projects(paths)]
+
+
+def name_outputs(paths):
+    ''' Expand a list of files and directories into (project file, output
+    name, note) for each project. The output name is the project's path
+    in the directory it was found in, suffix included, so foo.ta and
+    foo.tb, or a/foo.tb and b/foo.tb, get different images. Projects that
+    would still share a name (e.g., from two directories given on the
+    command line) get a number added, and note says so. '''
+    projects = []
+    used = set()
+    for ta_file, name in _walk_projects(paths):
+        note = ''
+        if name in used:
+            n = 2
+            while '%s-%d' % (name, n) in used:
+                n += 1
+            note = 'renamed: %s is already used by another project' % name
+            name = '%s-%d' % (name, n)
+        used.add(name)
+        projects.append((ta_file, name, note))
+    return projects
+
+
+def _make_dirs(path):
+    ''' os.makedirs, but other workers may be making the same directory '''
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+class BatchRenderer(object):
+    ''' Run projects without a window and save what they draw. Stands in
+    for the activity (TurtleMain in GNOME) of the TurtleArtWindow. '''
+
+    def __init__(self, lib_path, share_path, output_dir='.',
+                 width=_DEFAULT_WIDTH, height=_DEFAULT_HEIGHT,
+                 timeout=_DEFAULT_TIMEOUT, svg=False,
+                 max_stack_depth=MAX_STACK_DEPTH, compiled=False):
+        self.lib_path = lib_path
+        self.share_path = share_path
+        self.output_dir = output_dir
+        self.width = width
+        self.height = height
+        self.timeout = timeout
+        self.svg = svg
+        self.max_stack_depth = max_stack_depth
+        self.compiled = compiled
+        self.init_complete = True
+
+    def _build_window(self):
+        ''' A non-interactive TurtleArtWindow drawing on an image surface '''
+        turtle_canvas = cairo.ImageSurface(cairo.FORMAT_RGB24,
+                                           self.width, self.height)
+        tw = TurtleArtWindow(None, self.lib_path, self.share_path,
+                             turtle_canvas=turtle_canvas, activity=self,
+                             running_sugar=False,
+                             canvas_size=(self.width, self.height))
+        tw.canvas.svg_recording = self.svg
+        tw.lc.trace = 0
+        tw.lc.max_stack_depth = self.max_stack_depth
+        tw.lc.compiled = self.compiled
+        return tw
+
+    def _start_alarm(self):
+        ''' The deadline is checked between time slices; the alarm stops
+        primitives that block for longer than that. '''
+        if hasattr(signal, 'alarm'):
+            signal.signal(signal.SIGALRM, _alarm_cb)
+            signal.alarm(int(self.timeout) + 1)
+
+    def _stop_alarm(self):
+        if hasattr(signal, 'alarm'):
+            signal.alarm(0)
+
+    def _stacks_to_run(self, tw):
+        ''' The 'start' stack, or else every stack that isn't an action
+        definition (as in run_button) '''
+        for blk in tw.just_blocks():
+            if find_start_stack(blk):
+                return [blk]
+        return [blk for blk in tw.just_blocks() if find_block_to_run(blk)]
+
+    def _run(self, tw, deadline):
+        ''' Run the project to completion or until the deadline. As in
+        run_button, the stacks run at the same time. '''
+        tw.canvas.setup_svg_surface()
+        for blk in self._stacks_to_run(tw):
+            tw.lc.find_value_blocks()
+            code = tw.lc.generate_code(find_top_block(blk), tw.just_blocks())
+            tw.lc.run_blocks(code, concurrent=True)
+        self._run_to_end(tw, deadline)
+
+    def _run_to_end(self, tw, deadline):
+        ''' Step the running program until it stops; raises ProjectError
+        if it stopped with an error '''
+        while tw.lc.doevalstep():
+            if time.time() > deadline:
+                tw.lc.stop_logo()
+                raise ProjectTimeout()
+            tw.lc.sleep_until_resume(deadline - time.time())
+        if tw.lc.last_error is not None:
+            raise ProjectError(tw.lc.last_error)
+
+    def render(self, ta_file, name=None):
+        ''' Load, run and save one project as name.png (and name.svg) in
+        the output directory, name defaulting to the project's file name;
+        returns (status, message) where status is 'ok', 'timeout' or
+        'error'. '''
+        if name is None:
+            name = os.path.basename(ta_file)
+        png_path = os.path.join(self.output_dir, name + '.png')
+        svg_path = os.path.join(self.output_dir, name + '.svg')
+        if not os.path.isdir(os.path.dirname(png_path)):
+            _make_dirs(os.path.dirname(png_path))
+        deadline = time.time() + self.timeout
+        self._start_alarm()
+        tw = None
+        status, message = 'ok', ''
+        try:
+            tw = self._build_window()
+            tw.load_start(ta_file)
+            self._run(tw, deadline)
+        except ProjectTimeout:
+            status, message = 'timeout', 'stopped after %ds' % self.timeout
+        except ProjectError as e:
+            status, message = 'error', str(e)
+        except Exception as e:
+            traceback.print_exc()
+            status, message = 'error', '%s: %s' % (type(e).__name__, e)
+        finally:
+            self._stop_alarm()
+        if tw is not None:
+            # Save whatever was drawn, even if the project did not finish
+            save_picture(tw.canvas, png_path)
+            if self.svg:
+                tw.canvas.svg_close(svg_path)
+        return status, message
+
+
+def _render_job(job):
+    ''' Pool worker: render one project in this process '''
+    ta_file, name, options = job
+    starttime = time.time()
+    status, message = BatchRenderer(**options).render(ta_file, name)
+    return ta_file, status, message, time.time() - starttime
+
+
+def render_projects(projects, lib_path, share_path, output_dir='.',
+                    width=_DEFAULT_WIDTH, height=_DEFAULT_HEIGHT,
+                    timeout=_DEFAULT_TIMEOUT, svg=False, jobs=None,
+                    max_stack_depth=MAX_STACK_DEPTH, compiled=False):
+    ''' Render projects, a list of (project file, output name), in
+    parallel, one fresh process per project so that plugin and
+    interpreter state does not leak between them. Yields (ta_file,
+    status, message, seconds) as each project finishes. '''
+    options = {'lib_path': lib_path, 'share_path': share_path,
+               'output_dir': output_dir, 'width': width, 'height': height,
+               'timeout': timeout, 'svg': svg,
+               'max_stack_depth': max_stack_depth, 'compiled': compiled}
+    pool = multiprocessing.Pool(jobs, maxtasksperchild=1)
+    try:
+        for result in pool.imap_unordered(
+                _render_job, [(ta_file, name, options)
+                              for ta_file, name in projects]):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def main(lib_path, share_path, argv=None):
+    ''' Command-line entry point; returns the exit status '''
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'ho:W:H:t:j:scd:',
+                                   ['help', 'output_dir=', 'width=',
+                                    'height=', 'timeout=', 'jobs=', 'svg',
+                                    'compiled', 'max_depth='])
+    except getopt.GetoptError as err:
+        print str(err)
+        print _HELP_MSG
+        return 2
+    output_dir = '.'
+    width, height = _DEFAULT_WIDTH, _DEFAULT_HEIGHT
+    timeout = _DEFAULT_TIMEOUT
+    jobs = None
+    svg = False
+    max_stack_depth = MAX_STACK_DEPTH
+    compiled = False
+    try:
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                print _HELP_MSG
+                return 0
+            elif o in ('-o', '--output_dir'):
+                output_dir = a
+            elif o in ('-W', '--width'):
+                width = int(a)
+            elif o in ('-H', '--height'):
+                height = int(a)
+            elif o in ('-t', '--timeout'):
+                timeout = float(a)
+            elif o in ('-j', '--jobs'):
+                jobs = int(a)
+            elif o in ('-s', '--svg'):
+                svg = True
+            elif o in ('-c', '--compiled'):
+                compiled = True
+            elif o in ('-d', '--max_depth'):
+                max_stack_depth = int(a)
+    except ValueError as err:
+        print str(err)
+        print _HELP_MSG
+        return 2
+
+    projects = name_outputs(args)
+    if not projects:
+        print _HELP_MSG
+        return 2
+    for ta_file, name, note in projects:
+        if note:
+            print '%-8s %s %s' % ('renamed', ta_file, note)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    failures = 0
+    for ta_file, status, message, seconds in render_projects(
+            [(ta_file, name) for ta_file, name, note in projects],
+            lib_path, share_path, output_dir=output_dir,
+            width=width, height=height, timeout=timeout, svg=svg,
+            jobs=jobs, max_stack_depth=max_stack_depth, compiled=compiled):
+        if status != 'ok':
+            failures += 1
+        print '%-8s %6.2fs %s %s' % (status, seconds, ta_file, message)
+    print '%d projects, %d failed' % (len(projects), failures)
+    return 1 if failures else 0
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' Interpreter benchmarks: run the samples and some synthetic stress
+projects without a window and report timings as JSON.
+
+    python -m TurtleArt.tabenchmark [options] [project.tb|directory ...]
+'''
+
+import ConfigParser
+import getopt
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from TurtleArt.talogo import MAX_STACK_DEPTH
+from TurtleArt.tautils import find_top_block, iter_data_from_file
+from TurtleArt.tabatch import (BatchRenderer, ProjectError, ProjectTimeout,
+                               find_projects)
+
+_DEFAULT_TIMEOUT = 120  # seconds
+
+_HELP_MSG = '''tabenchmark: usage is
+ \tpython -m TurtleArt.tabenchmark [options] [project.tb|directory ...]
+ \t-o, --output=FILE      write the JSON report to FILE (default: stdout)
+ \t-t, --timeout=SECONDS  maximum run time per project (default: %d)
+ \t-j, --jobs=N           number of worker processes (default: 1)
+ \t-c, --compiled         run the projects in compiled mode
+ \t-d, --max_depth=N      most action stacks running inside each other
+ \t                       (default: %d)
+ \t-S, --no_samples       skip the bundled samples
+ \t-X, --no_synthetic     skip the synthetic stress projects
+With no projects given, the samples directory is used.''' % (
+    _DEFAULT_TIMEOUT, MAX_STACK_DEPTH)
+
+
+def _stack(*blocks):
+    ''' A stack of statement blocks, see _project_data '''
+    return list(blocks)
+
+
+def _project_data(*stacks):
+    ''' Build project data (as saved in a .tb file) from nested block
+    descriptions. A statement is (label, [args], [clamps]) and is followed
+    by the next statement of its stack; a value is (label, [args]). Labels
+    are block names or [name, value] pairs. '''
+    data = []
+
+    def new_block(label):
+        data.append([len(data), label, 0, 0, None])
+        return data[-1]
+
+    def add_value(node, parent):
+        label, args = node
+        block = new_block(label)
+        connections = [parent] + [add_value(a, block[0]) for a in args]
+        name = label[0] if isinstance(label, list) else label
+        if name not in ('plus2', 'minus2', 'product2', 'division2'):
+            connections.append(None)
+        block[4] = connections
+        return block[0]
+
+    def add_stack(statements, previous):
+        first = None
+        for label, args, clamps in statements:
+            block = new_block(label)
+            if first is None:
+                first = block[0]
+            else:
+                data[previous][4][-1] = block[0]
+            connections = [previous] + \
+                [add_value(a, block[0]) for a in args] + \
+                [add_stack(c, block[0]) for c in clamps] + [None]
+            block[4] = connections
+            previous = block[0]
+        return first
+
+    for statements in stacks:
+        add_stack(statements, None)
+    return data
+
+
+def _number(n):
+    return (['number', n], [])
+
+
+def _string(s):
+    return (['string', s], [])
+
+
+def _box(name):
+    return ('box', [_string(name)])
+
+
+def _synthetic_projects():
+    ''' Stress projects, each exercising one part of the interpreter '''
+    return {
+        'synthetic:repeat-100k': _project_data(_stack(
+            ('start', [], []),
+            ('repeat', [_number(100000)], [_stack(
+                ('forward', [_number(1)], []),
+                ('right', [_number(1)], []))]))),
+        'synthetic:recursion-2k': _project_data(
+            _stack(
+                ('start', [], []),
+                ('storein', [_string('n'), _number(2000)], []),
+                ('stack', [_string('recurse')], [])),
+            _stack(
+                ('hat', [_string('recurse')], []),
+                ('storein', [_string('n'),
+                             ('minus2', [_box('n'), _number(1)])], []),
+                ('right', [_number(1)], []),
+                ('if', [('greater2', [_box('n'), _number(0)])],
+                 [_stack(('stack', [_string('recurse')], []))]))),
+        'synthetic:heap-20k': _project_data(_stack(
+            ('start', [], []),
+            ('repeat', [_number(10000)], [_stack(
+                ('push', [_number(1)], []),
+                ('push', [_number(2)], []),
+                ('forward', [('pop', [])], []),
+                ('right', [('pop', [])], []))]))),
+        'synthetic:fill-360': _project_data(_stack(
+            ('start', [], []),
+            ('repeat', [_number(360)], [_stack(
+                ('startfill', [], []),
+                ('repeat', [_number(4)], [_stack(
+                    ('forward', [_number(300)], []),
+                    ('right', [_number(90)], []))]),
+                ('stopfill', [], []),
+                ('right', [_number(1)], []))]))),
+    }
+
+
+def _peak_memory():
+    ''' Peak resident memory of this process in KiB, if known '''
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss / 1024  # reported in bytes
+    return maxrss
+
+
+class BenchmarkRunner(BatchRenderer):
+    ''' Time loading, code generation and running of one project '''
+
+    def __init__(self, lib_path, share_path, timeout=_DEFAULT_TIMEOUT,
+                 compiled=False, max_stack_depth=MAX_STACK_DEPTH):
+        BatchRenderer.__init__(self, lib_path, share_path, timeout=timeout,
+                               max_stack_depth=max_stack_depth,
+                               compiled=compiled)
+
+    def measure(self, name, data=None):
+        ''' Returns a dictionary of measurements for the project data, or
+        for the project file name if there is no data '''
+        result = {'project': name, 'status': 'ok'}
+        codegen_time = run_time = 0
+        blocks_run = None
+        self._start_alarm()
+        try:
+            tw = self._build_window()
+
+            starttime = time.time()
+            if data is None:
+                data = iter_data_from_file(name)
+            tw.process_data(data)
+            result['load_time'] = time.time() - starttime
+            result['load_phases'] = tw.load_timings
+            result['blocks'] = len(tw.just_blocks())
+
+            deadline = time.time() + self.timeout
+            blocks_run = tw.lc.blocks_run
+            codes = []
+            for blk in self._stacks_to_run(tw):
+                starttime = time.time()
+                tw.lc.find_value_blocks()
+                codes.append(tw.lc.generate_code(find_top_block(blk),
+                                                 tw.just_blocks()))
+                codegen_time += time.time() - starttime
+
+            # The stacks run at the same time, as in run_button
+            starttime = time.time()
+            try:
+                for code in codes:
+                    tw.lc.run_blocks(code, concurrent=True)
+                self._run_to_end(tw, deadline)
+            finally:
+                run_time += time.time() - starttime
+        except ProjectTimeout:
+            result['status'] = 'timeout'
+        except ProjectError as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        except Exception as e:
+            traceback.print_exc()
+            result['status'] = 'error'
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+        finally:
+            self._stop_alarm()
+        if blocks_run is not None:
+            blocks_run = tw.lc.blocks_run - blocks_run
+            result['codegen_time'] = codegen_time
+            result['run_time'] = run_time
+            result['blocks_run'] = blocks_run
+            if run_time > 0:
+                result['blocks_per_second'] = blocks_run / run_time
+        result['peak_memory_kb'] = _peak_memory()
+        return result
+
+
+def _benchmark_job(job):
+    ''' Pool worker: measure one project in a fresh process so that the
+    peak memory belongs to that project alone '''
+    name, options = job
+    data = _synthetic_projects().get(name)
+    return BenchmarkRunner(**options).measure(name, data)
+
+
+def run_benchmarks(projects, lib_path, share_path, timeout=_DEFAULT_TIMEOUT,
+                   compiled=False, jobs=1, max_stack_depth=MAX_STACK_DEPTH):
+    ''' Measure each project (a file name or a synthetic project name) and
+    return the list of results in the same order '''
+    options = {'lib_path': lib_path, 'share_path': share_path,
+               'timeout': timeout, 'compiled': compiled,
+               'max_stack_depth': max_stack_depth}
+    pool = multiprocessing.Pool(jobs, maxtasksperchild=1)
+    try:
+        results = pool.map(_benchmark_job,
+                           [(name, options) for name in projects])
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def _summary(results):
+    ''' Totals over the projects that finished '''
+    finished = [r for r in results if r['status'] == 'ok']
+    run_time = sum(r['run_time'] for r in finished)
+    blocks_run = sum(r['blocks_run'] for r in finished)
+    summary = {
+        'projects': len(results),
+        'failed': len(results) - len(finished),
+        'load_time': sum(r['load_time'] for r in finished),
+        'codegen_time': sum(r['codegen_time'] for r in finished),
+        'run_time': run_time,
+        'blocks_run': blocks_run,
+        'peak_memory_kb': max([r['peak_memory_kb'] for r in results] or
+                              [None])}
+    if run_time > 0:
+        summary['blocks_per_second'] = blocks_run / run_time
+    return summary
+
+
+def _version(share_path):
+    ''' The activity version, to tell releases apart in the reports '''
+    activity_info = ConfigParser.ConfigParser()
+    activity_info.read(os.path.join(share_path, 'activity', 'activity.info'))
+    try:
+        return activity_info.get('Activity', 'activity_version')
+    except ConfigParser.Error:
+        return None
+
+
+def main(lib_path, share_path, argv=None):
+    ''' Command-line entry point; returns the exit status '''
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'ho:t:j:cd:SX',
+                                   ['help', 'output=', 'timeout=', 'jobs=',
+                                    'compiled', 'max_depth=', 'no_samples',
+                                    'no_synthetic'])
+    except getopt.GetoptError as err:
+        print >> sys.stderr, str(err)
+        print >> sys.stderr, _HELP_MSG
+        return 2
+    output = None
+    timeout = _DEFAULT_TIMEOUT
+    jobs = 1
+    compiled = False
+    max_stack_depth = MAX_STACK_DEPTH
+    samples = synthetic = True
+    try:
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                print _HELP_MSG
+                return 0
+            elif o in ('-o', '--output'):
+                output = a
+            elif o in ('-t', '--timeout'):
+                timeout = float(a)
+            elif o in ('-j', '--jobs'):
+                jobs = int(a)
+            elif o in ('-c', '--compiled'):
+                compiled = True
+            elif o in ('-d', '--max_depth'):
+                max_stack_depth = int(a)
+            elif o in ('-S', '--no_samples'):
+                samples = False
+            elif o in ('-X', '--no_synthetic'):
+                synthetic = False
+    except ValueError as err:
+        print >> sys.stderr, str(err)
+        print >> sys.stderr, _HELP_MSG
+        return 2
+
+    if not args and samples:
+        args = [os.path.join(share_path, 'samples')]
+    projects = find_projects(args)
+    if synthetic:
+        projects += sorted(_synthetic_projects().keys())
+
+    results = run_benchmarks(projects, lib_path, share_path,
+                             timeout=timeout, compiled=compiled, jobs=jobs,
+                             max_stack_depth=max_stack_depth)
+    report = {'version': _version(share_path),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'compiled': compiled,
+              'summary': _summary(results),
+              'results': results}
+    if output is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print
+    else:
+        fd = open(output, 'w')
+        json.dump(report, fd, indent=2, sort_keys=True)
+        fd.close()
+        for r in results:
+            print >> sys.stderr, '%-8s %10s %s' % (
+                r['status'], '%.0f/s' % r.get('blocks_per_second', 0),
+                r['project'])
+    return 1 if report['summary']['failed'] else 0
+
+
+if __name__ == '__main__':
+    _path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main(_path, _path))
@@ -29,7 +29,8 @@ from .taconstants import (EXPANDABLE, EXPANDABLE_ARGS, OLD_NAMES, CONSTANTS,
 from .tapalette import (palette_blocks, block_colors, expandable_blocks,
                         content_blocks, block_names, block_primitives,
                         block_styles, special_block_colors)
-from .tasprite_factory import (SVG, svg_str_to_pixbuf)
+from .tasprite_factory import SVG
+from .tashapecache import shape_cache
 from . import sprites
 
 from .tautils import (debug_output, error_output)
@@ -73,8 +74,19 @@ class Blocks:
 
     """ A class for the list of blocks and everything they share in common """
 
-    def __init__(self, font_scale_factor=1, decimal_point='.'):
+    def __init__(self, font_scale_factor=1, decimal_point='.',
+                 dock_cell_size=200):
         self.list = []
+        self._index = {}  # block -> position in self.list
+        self._blocks_by_spr = {}  # sprite -> block
+        self._blocks_by_name = {}  # (name, scale) -> first such block
+        self._dock_cell_size = dock_cell_size
+        self._dock_cells = {}  # (column, row) -> set of (block, dock number)
+        self._block_dock_cells = {}  # block -> [((column, row), dock number)]
+        self._moved = set()  # blocks whose docks need to be indexed again
+        self._defer_shapes = False
+        self._deferred = []  # blocks waiting to be drawn
+        self._blank_shapes = {}  # (width, height) -> blank surface
         self.max_width = 400
         self.font_scale_factor = font_scale_factor
         self.decimal_point = decimal_point
@@ -85,21 +97,44 @@ class Blocks:
         else:
             return(self.list[i])
 
+    def get_index(self, block):
+        ''' Position of block in the list (or None) '''
+        return self._index.get(block)
+
     def swap(self, blk1, blk2):
-        i1 = self.list.index(blk1)
-        i2 = self.list.index(blk2)
+        i1 = self._index[blk1]
+        i2 = self._index[blk2]
         self.list[i1] = blk2
         self.list[i2] = blk1
+        self._index[blk1] = i2
+        self._index[blk2] = i1
 
     def length_of_list(self):
         return(len(self.list))
 
     def append_to_list(self, block):
+        self._index[block] = len(self.list)
         self.list.append(block)
+        if block.spr is not None:
+            self._blocks_by_spr[block.spr] = block
+        if (block.name, block.scale) not in self._blocks_by_name:
+            self._blocks_by_name[(block.name, block.scale)] = block
+        self._moved.add(block)
 
     def remove_from_list(self, block):
-        if block in self.list:
-            self.list.remove(block)
+        i = self._index.pop(block, None)
+        if i is None:
+            return
+        del self.list[i]
+        # Blocks after the removed one move down one place
+        for j in range(i, len(self.list)):
+            self._index[self.list[j]] = j
+        if self._blocks_by_spr.get(block.spr) is block:
+            del self._blocks_by_spr[block.spr]
+        if self._blocks_by_name.get((block.name, block.scale)) is block:
+            del self._blocks_by_name[(block.name, block.scale)]
+        self._moved.discard(block)
+        self._remove_docks(block)
 
     def print_list(self, block_type=None):
         for i, block in enumerate(self.list):
@@ -113,17 +148,98 @@ class Blocks:
         self.font_scale_factor = scale
 
     def spr_to_block(self, spr):
-        for b in self.list:
-            if spr == b.spr:
-                return b
+        return self._blocks_by_spr.get(spr)
+
+    def find_block_by_name(self, name, scale):
+        ''' A block with this name and scale, if one was added (blocks
+        renamed or rescaled since then may be missed) '''
+        block = self._blocks_by_name.get((name, scale))
+        if block is not None and block.name == name and \
+                block.scale == scale and not block.shape_deferred:
+            return block
         return None
 
+    def set_defer_shapes(self, state):
+        ''' While deferred, blocks that change shape get their new size
+        and docks at once but are drawn only when this is turned off. '''
+        self._defer_shapes = state
+        if not state:
+            deferred = self._deferred
+            self._deferred = []
+            self._blank_shapes = {}
+            for block in deferred:
+                block.shape_deferred = False
+                block.refresh()
+
+    def defer_shape(self, block):
+        ''' Returns True if the block is to be drawn later '''
+        if not self._defer_shapes:
+            return False
+        if not block.shape_deferred:
+            block.shape_deferred = True
+            self._deferred.append(block)
+        return True
+
+    def blank_shape(self, width, height):
+        ''' A surface for deferred blocks to show until they are drawn '''
+        size = (int(width), int(height))
+        if size not in self._blank_shapes:
+            self._blank_shapes[size] = cairo.ImageSurface(
+                cairo.FORMAT_ARGB32, size[0], size[1])
+        return self._blank_shapes[size]
+
+    def sprite_updated(self, spr):
+        ''' Called by the sprite list when a sprite moves or is resized;
+        the docks of its block are indexed again on the next search. '''
+        block = self._blocks_by_spr.get(spr)
+        if block is not None:
+            self._moved.add(block)
+
+    def _dock_cell(self, x, y):
+        return (int(x // self._dock_cell_size), int(y // self._dock_cell_size))
+
+    def _remove_docks(self, block):
+        for cell, dockn in self._block_dock_cells.pop(block, []):
+            docks = self._dock_cells[cell]
+            docks.discard((block, dockn))
+            if not docks:
+                del self._dock_cells[cell]
+
+    def _add_docks(self, block):
+        if block.spr is None or block.docks is None:
+            return
+        x, y = block.spr.get_xy()
+        cells = []
+        for dockn, dock in enumerate(block.docks):
+            cell = self._dock_cell(x + dock[2], y + dock[3])
+            if cell in self._dock_cells:
+                self._dock_cells[cell].add((block, dockn))
+            else:
+                self._dock_cells[cell] = set([(block, dockn)])
+            cells.append((cell, dockn))
+        self._block_dock_cells[block] = cells
+
+    def find_docks(self, x, y, distance):
+        ''' Return the (block, dock number) pairs with a dock that may be
+        within distance of (x, y), in the order of the block list. '''
+        for block in self._moved:
+            self._remove_docks(block)
+            self._add_docks(block)
+        self._moved.clear()
+        column0, row0 = self._dock_cell(x - distance, y - distance)
+        column1, row1 = self._dock_cell(x + distance, y + distance)
+        docks = []
+        for column in range(column0, column1 + 1):
+            for row in range(row0, row1 + 1):
+                docks.extend(self._dock_cells.get((column, row), []))
+        docks.sort(key=lambda dock: (self._index[dock[0]], dock[1]))
+        return docks
+
     def get_next_block(self, block):
         if block is None:
             return None
-        try:
-            i = self.list.index(block)
-        except ValueError:
+        i = self._index.get(block)
+        if i is None:
             return None
         i += 1
         if i < len(self.list):
@@ -197,6 +313,9 @@ class Block:
         self.name = name
         self.colors = colors
         self._custom_colors = False
+        self._tint = None  # colors drawn in place of self.colors
+        self.shape_deferred = False  # see Blocks.set_defer_shapes
+        self._sprite_to_come = False  # being made, with a sprite to follow
         self.scale = scale
         self.docks = None
         self.connections = None
@@ -277,10 +396,8 @@ class Block:
         # If there is already a block with the same name, reuse it
         copy_block = None
         if self.cloneable():
-            for b in self.block_list.list:
-                if b.scale == self.scale and b.name == self.name:
-                    copy_block = b
-                    break
+            copy_block = self.block_list.find_block_by_name(self.name,
+                                                            self.scale)
         self._new_block_from_factory(sprite_list, x, y, copy_block)
 
         if name in block_primitives:
@@ -429,6 +546,19 @@ class Block:
         self._custom_colors = True
         self.refresh()
 
+    def set_tint(self, colors):
+        ''' Temporarily draw the block in other colors; the colors saved
+        with the project are left alone '''
+        self._tint = colors[:]
+        self.refresh()
+
+    def clear_tint(self):
+        ''' Go back to the colors the block had before set_tint '''
+        if self._tint is None:
+            return
+        self._tint = None
+        self.refresh()
+
     def refresh(self):
         if self.spr is None:
             return
@@ -622,7 +752,11 @@ class Block:
             if self.expandable() and self.type == 'block':
                 self.svg.set_show(True)
 
+            # While shapes are deferred, a new block starts out with a
+            # blank shape too.
+            self._sprite_to_come = sprite_list is not None
             self._make_block(self.svg)
+            self._sprite_to_come = False
 
             if sprite_list is not None:
                 self.spr = sprites.Sprite(sprite_list, x, y, self.shapes[0])
@@ -773,6 +907,9 @@ class Block:
         self.unknown = True
 
     def _set_colors(self, svg):
+        if self._tint is not None:
+            self.svg.set_colors(self._tint)
+            return
         if self._custom_colors:
             self.svg.set_colors(self.colors)
             return
@@ -1338,30 +1475,34 @@ class Block:
         self._set_colors(svg)
         self.svg.set_gradient(True, GRADIENT_COLOR)
         self.svg.clear_docks()
+        # Blocks drawn with the same settings share their shapes
+        key = (function.__name__, arg, self.svg.get_parameters())
+        shape = shape_cache.get(key)
+        if shape is not None:
+            state, shapes = shape
+            self.shapes = shapes[:]
+            self.svg.set_state(state)
+            self.width = self.svg.get_width()
+            self.height = self.svg.get_height()
+            return
         if arg is None:
-            pixbuf = svg_str_to_pixbuf(function())
+            args = ()
         else:
-            pixbuf = svg_str_to_pixbuf(function(arg))
+            args = (arg,)
+        if (self.spr is not None or self._sprite_to_come) and \
+                self.block_list.defer_shape(self):
+            # Only the size and docks are needed until the block is drawn
+            self.svg.calculate(function, *args)
+            self.width = self.svg.get_width()
+            self.height = self.svg.get_height()
+            self.svg.set_gradient(False)
+            blank = self.block_list.blank_shape(self.width, self.height)
+            self.shapes = [blank, blank]
+            return
+        self.shapes[0] = self.svg.to_surface(function, *args)
         self.width = self.svg.get_width()
         self.height = self.svg.get_height()
-        self.shapes[0] = _pixbuf_to_cairo_surface(pixbuf,
-                                                  self.width, self.height)
         self.svg.set_gradient(False)
         self.svg.clear_docks()
-        if arg is None:
-            pixbuf = svg_str_to_pixbuf(function())
-        else:
-            pixbuf = svg_str_to_pixbuf(function(arg))
-        self.shapes[1] = _pixbuf_to_cairo_surface(pixbuf,
-                                                  self.width, self.height)
-
-
-def _pixbuf_to_cairo_surface(image, width, height):
-    surface = cairo.ImageSurface(
-        cairo.FORMAT_ARGB32, int(width), int(height))
-    context = cairo.Context(surface)
-    context = gtk.gdk.CairoContext(context)
-    context.set_source_pixbuf(image, 0, 0)
-    context.rectangle(0, 0, int(width), int(height))
-    context.fill()
-    return surface
+        self.shapes[1] = self.svg.to_surface(function, *args)
+        shape_cache.add(key, self.svg.get_state(), self.shapes[:])
@@ -21,7 +21,8 @@
 # THE SOFTWARE.
 
 import gtk
-from math import pi
+import gobject
+from math import pi, sqrt
 import os
 import pango
 import cairo
@@ -113,22 +114,46 @@ class TurtleGraphics:
         self._shade = 0
         self._color = 0
         self._gray = 100
-        self.cr_svg = None  # Surface used for saving to SVG
+        # Drawing operations recorded for saving to SVG, as a list of
+        # (function, args) tuples; each function is called as f(cr, *args)
+        self.display_list = None
+        self.svg_recording = True  # Set to False to never record
+        # Most times a second the drawing is shown (turtleblocks.py --fps);
+        # 0 shows it at the end of each time slice of the running program
+        self.fps = 0
+        self._dirty = None  # Bounding box of the area to refresh
+        self._inval_id = None
+        self._pen_size = 5
+        self._path_end = None  # End point of the path not yet stroked
+        self._path_rgb = None
+        self._path_extents = None
 
         # Build a cairo.Context from a cairo.XlibSurface
         self.canvas = cairo.Context(self.turtle_window.turtle_canvas)
         cr = gtk.gdk.CairoContext(self.canvas)
         cr.set_line_cap(1)  # Set the line cap to be round
+        # Round joins make a stroked path look like its stroked segments
+        cr.set_line_join(cairo.LINE_JOIN_ROUND)
 
         self.set_pen_size(5)
 
     def setup_svg_surface(self):
-        ''' Set up a surface for saving to SVG '''
-        svg_surface = cairo.SVGSurface(self.get_svg_path(),
-                                       self.width, self.height)
-        self.svg_surface = svg_surface
-        self.cr_svg = cairo.Context(svg_surface)
-        self.cr_svg.set_line_cap(1)  # Set the line cap to be round
+        ''' Start recording the drawing for saving to SVG '''
+        self.stroke_path()
+        if self.svg_recording:
+            self._start_display_list()
+
+    def _start_display_list(self):
+        ''' Start a new display list with the current pen state '''
+        self.display_list = []
+        self._record(cairo.Context.set_line_width, self._pen_size)
+        self._record(cairo.Context.set_source_rgb, self._fgrgb[0] / 255.,
+                     self._fgrgb[1] / 255., self._fgrgb[2] / 255.)
+
+    def _record(self, function, *args):
+        ''' Add a drawing operation to the display list (if recording) '''
+        if self.display_list is not None:
+            self.display_list.append((function, args))
 
     def get_svg_path(self):
         '''We use a separate file for the svg used for generating Sugar icons
@@ -141,6 +166,8 @@ class TurtleGraphics:
 
     def fill_polygon(self, poly_points):
         ''' Draw the polygon... '''
+        self.stroke_path()
+
         def _fill_polygon(cr, poly_points):
             cr.new_path()
             for i, p in enumerate(poly_points):
@@ -155,58 +182,64 @@ class TurtleGraphics:
                 else:  # line
                     cr.line_to(p[1], p[2])
             cr.close_path()
+            extents = cr.fill_extents()
             cr.fill()
+            return extents
 
-        _fill_polygon(self.canvas, poly_points)
-        self.inval()
-        if self.cr_svg is not None:
-            _fill_polygon(self.cr_svg, poly_points)
+        x1, y1, x2, y2 = _fill_polygon(self.canvas, poly_points)
+        self.inval(x1, y1, x2 - x1, y2 - y1)
+        self._record(_fill_polygon, poly_points)
 
     def clearscreen(self):
         '''Clear the canvas and reset most graphics attributes to defaults.'''
+        self.stroke_path()
 
-        def _clearscreen(cr):
+        def _clearscreen(cr, rgb, w, h):
             cr.move_to(0, 0)
-            self._bgrgb = DEFAULT_BACKGROUND_COLOR
-            cr.set_source_rgb(self._bgrgb[0] / 255.,
-                              self._bgrgb[1] / 255.,
-                              self._bgrgb[2] / 255.)
-            cr.rectangle(0, 0, self.width * 2, self.height * 2)
+            cr.set_source_rgb(rgb[0] / 255., rgb[1] / 255., rgb[2] / 255.)
+            cr.rectangle(0, 0, w * 2, h * 2)
             cr.fill()
 
-        _clearscreen(self.canvas)
+        self._bgrgb = DEFAULT_BACKGROUND_COLOR
+        _clearscreen(self.canvas, self._bgrgb, self.width, self.height)
         self.inval()
-        if self.cr_svg is not None:
-            _clearscreen(self.cr_svg)
+        # Nothing drawn before is visible any more
+        if self.display_list is not None:
+            self._start_display_list()
+        self._record(_clearscreen, self._bgrgb, self.width, self.height)
 
     def rarc(self, x, y, r, a, heading):
         ''' draw a clockwise arc '''
+        self.stroke_path()
+
         def _rarc(cr, x, y, r, a, h):
             cr.arc(x, y, r, (h - 180) * DEGTOR, (h - 180 + a) * DEGTOR)
             cr.stroke()
 
         _rarc(self.canvas, x, y, r, a, heading)
-        self.inval()
+        self._inval_circle(x, y, r)
 
-        if self.cr_svg is not None:
-            _rarc(self.cr_svg, x, y, r, a, heading)
+        self._record(_rarc, x, y, r, a, heading)
 
     def larc(self, x, y, r, a, heading):
         ''' draw a counter-clockwise arc '''
+        self.stroke_path()
+
         def _larc(cr, x, y, r, a, h):
             cr.arc_negative(x, y, r, h * DEGTOR, (h - a) * DEGTOR)
             cr.stroke()
 
         _larc(self.canvas, x, y, r, a, heading)
-        self.inval()
-        if self.cr_svg is not None:
-            _larc(self.cr_svg, x, y, r, a, heading)
+        self._inval_circle(x, y, r)
+        self._record(_larc, x, y, r, a, heading)
 
     def set_pen_size(self, pen_size):
         ''' Set the pen size '''
+        if pen_size != self._pen_size:
+            self.stroke_path()
+        self._pen_size = pen_size
         self.canvas.set_line_width(pen_size)
-        if self.cr_svg is not None:
-            self.cr_svg.set_line_width(pen_size)
+        self._record(cairo.Context.set_line_width, pen_size)
 
     def fillscreen(self, c, s):
         ''' Deprecated method: Fill screen with color/shade '''
@@ -214,6 +247,7 @@ class TurtleGraphics:
 
     def fillscreen_with_gray(self, color, shade, gray):
         ''' Fill screen with color/shade/gray and reset to defaults '''
+        self.stroke_path()
 
         save_rgb = self._fgrgb[:]
 
@@ -249,8 +283,9 @@ class TurtleGraphics:
 
         _fillscreen(self.canvas, self._fgrgb, self.width, self.height)
         self.inval()
-        if self.cr_svg is not None:
-            _fillscreen(self.cr_svg, self._fgrgb, self.width, self.height)
+        if self.display_list is not None:
+            self._start_display_list()
+        self._record(_fillscreen, self._fgrgb[:], self.width, self.height)
 
         self._fgrgb = save_rgb[:]
 
@@ -277,6 +312,7 @@ class TurtleGraphics:
 
     def draw_surface(self, surface, x, y, w, h):
         ''' Draw a surface '''
+        self.stroke_path()
 
         def _draw_surface(cr, surface, x, y, w, h):
             cc = gtk.gdk.CairoContext(cr)
@@ -285,12 +321,12 @@ class TurtleGraphics:
             cc.fill()
 
         _draw_surface(self.canvas, surface, x, y, w, h)
-        self.inval()
-        if self.cr_svg is not None:
-            _draw_surface(self.cr_svg, surface, x, y, w, h)
+        self.inval(x, y, w, h)
+        self._record(_draw_surface, surface, x, y, w, h)
 
     def draw_pixbuf(self, pixbuf, a, b, x, y, w, h, heading):
         ''' Draw a pixbuf '''
+        self.stroke_path()
 
         def _draw_pixbuf(cr, pixbuf, a, b, x, y, w, h, heading):
             # Build a gtk.gdk.CairoContext from a cairo.Context to access
@@ -307,9 +343,10 @@ class TurtleGraphics:
             cc.restore()
 
         _draw_pixbuf(self.canvas, pixbuf, a, b, x, y, w, h, heading)
-        self.inval()
-        if self.cr_svg is not None:
-            _draw_pixbuf(self.cr_svg, pixbuf, a, b, x, y, w, h, heading)
+        # The image is rotated around its center
+        r = sqrt(w * w + h * h) / 2.
+        self.inval(x + w / 2. - r, y + h / 2. - r, 2 * r, 2 * r)
+        self._record(_draw_pixbuf, pixbuf, a, b, x, y, w, h, heading)
 
     def set_font(self, font_name):
         ''' Set font used by draw_text '''
@@ -317,9 +354,10 @@ class TurtleGraphics:
 
     def draw_text(self, label, x, y, size, width, heading, scale):
         ''' Draw text '''
+        self.stroke_path()
 
         def _draw_text(cr, label, x, y, size, width, scale, heading, rgb,
-                       wrap=False):
+                       font, wrap=False):
             import textwrap
 
             final_scale = int(size * scale) * pango.SCALE
@@ -329,7 +367,7 @@ class TurtleGraphics:
 
             cc = pangocairo.CairoContext(cr)
             pl = cc.create_layout()
-            fd = pango.FontDescription(self._font)
+            fd = pango.FontDescription(font)
             fd.set_size(final_scale)
             pl.set_font_description(fd)
             if isinstance(label, (str, unicode)):
@@ -349,32 +387,61 @@ class TurtleGraphics:
 
         width *= scale
         _draw_text(self.canvas, label, x, y, size, width, scale, heading,
-                   self._fgrgb)
+                   self._fgrgb, self._font)
         self.inval()
-        if self.cr_svg is not None:  # and self.pendown:
-            _draw_text(self.cr_svg, label, x, y, size, width, scale, heading,
-                       self._fgrgb, wrap=True)
+        self._record(_draw_text, label, x, y, size, width, scale, heading,
+                     self._fgrgb[:], self._font, True)
 
     def set_source_rgb(self):
+        # The path not yet stroked is drawn with the previous color
+        if self._path_end is not None and self._fgrgb != self._path_rgb:
+            self.stroke_path()
+        self._path_rgb = self._fgrgb[:]
         r = self._fgrgb[0] / 255.
         g = self._fgrgb[1] / 255.
         b = self._fgrgb[2] / 255.
         self.canvas.set_source_rgb(r, g, b)
-        if self.cr_svg is not None:
-            self.cr_svg.set_source_rgb(r, g, b)
+        self._record(cairo.Context.set_source_rgb, r, g, b)
 
     def draw_line(self, x1, y1, x2, y2):
-        ''' Draw a line '''
+        ''' Draw a line: lines are added to a single path, which is stroked
+        by stroke_path when the pen changes, something else is drawn or the
+        invalidated region is flushed. '''
 
-        def _draw_line(cr, x1, y1, x2, y2):
-            cr.move_to(x1, y1)
+        def _draw_line(cr, x1, y1, x2, y2, move):
+            if move:
+                cr.move_to(x1, y1)
             cr.line_to(x2, y2)
-            cr.stroke()
 
-        _draw_line(self.canvas, x1, y1, x2, y2)
-        if self.cr_svg is not None:
-            _draw_line(self.cr_svg, x1, y1, x2, y2)
-        self.inval()
+        move = self._path_end != (x1, y1)
+        _draw_line(self.canvas, x1, y1, x2, y2, move)
+        self._record(_draw_line, x1, y1, x2, y2, move)
+        self._path_end = (x2, y2)
+        if self._path_extents is None:
+            self._path_extents = [x1, y1, x1, y1]
+        extents = self._path_extents
+        for x, y in ((x1, y1), (x2, y2)):
+            extents[0] = min(extents[0], x)
+            extents[1] = min(extents[1], y)
+            extents[2] = max(extents[2], x)
+            extents[3] = max(extents[3], y)
+        # Lines drawn outside of a running program (e.g., by a remote
+        # turtle) have no time slice to end; the flush strokes them too.
+        pad = self._pen_size / 2.
+        self.inval(min(x1, x2) - pad, min(y1, y2) - pad,
+                   abs(x2 - x1) + 2 * pad, abs(y2 - y1) + 2 * pad)
+
+    def stroke_path(self):
+        ''' Stroke the lines drawn since the last call '''
+        if self._path_end is None:
+            return
+        self.canvas.stroke()
+        self._record(cairo.Context.stroke)
+        x1, y1, x2, y2 = self._path_extents
+        self._path_end = None
+        self._path_extents = None
+        pad = self._pen_size / 2.
+        self.inval(x1 - pad, y1 - pad, x2 - x1 + 2 * pad, y2 - y1 + 2 * pad)
 
     def get_color_index(self, r, g, b, a=0):
         ''' Find the closest palette entry to the rgb triplet '''
@@ -411,6 +478,7 @@ class TurtleGraphics:
 
     def get_pixel(self, x, y):
         ''' Read the pixel at x, y '''
+        self.stroke_path()
         if self.turtle_window.interactive_mode:
             x = int(x)
             y = int(y)
@@ -431,16 +499,72 @@ class TurtleGraphics:
         else:
             return(-1, -1, -1, -1)
 
-    def svg_close(self):
-        ''' Close current SVG graphic '''
-        self.cr_svg.show_page()
-        self.svg_surface.flush()
-        self.svg_surface.finish()
+    def svg_close(self, file_name=None):
+        ''' Render the recorded drawing to the SVG file '''
+        self.stroke_path()
+        if self.display_list is None:
+            return
+        if file_name is None:
+            file_name = self.get_svg_path()
+        svg_surface = cairo.SVGSurface(file_name,
+                                       self.width, self.height)
+        cr = cairo.Context(svg_surface)
+        cr.set_line_cap(1)  # Set the line cap to be round
+        cr.set_line_join(cairo.LINE_JOIN_ROUND)
+        for function, args in self.display_list:
+            function(cr, *args)
+        cr.show_page()
+        svg_surface.flush()
+        svg_surface.finish()
 
     def svg_reset(self):
-        ''' Reset svg flags '''
-        self.cr_svg = None
-
-    def inval(self):
-        ''' Invalidate a region for gtk '''
-        self.turtle_window.inval_all()
+        ''' Stop recording '''
+        self.display_list = None
+
+    def _inval_circle(self, x, y, r):
+        ''' Invalidate the bounding box of a circle drawn with the pen '''
+        r += self._pen_size / 2.
+        self.inval(x - r, y - r, 2 * r, 2 * r)
+
+    def inval(self, x=None, y=None, w=None, h=None):
+        ''' Invalidate a region for gtk (the whole canvas if no region is
+        given). Regions are accumulated and passed on by flush_inval. '''
+        if not self.turtle_window.interactive_mode:
+            return
+        if x is None:
+            area = (0, 0, self.width, self.height)
+        else:
+            # Allow for antialiasing at the edges
+            area = (int(x) - 1, int(y) - 1, int(x + w) + 2, int(y + h) + 2)
+        if self._dirty is None:
+            self._dirty = area
+        else:
+            self._dirty = (min(self._dirty[0], area[0]),
+                           min(self._dirty[1], area[1]),
+                           max(self._dirty[2], area[2]),
+                           max(self._dirty[3], area[3]))
+        # Make sure the area gets refreshed even if no program is running
+        if self._inval_id is None:
+            if self.fps > 0:
+                self._inval_id = gobject.timeout_add(
+                    int(1000 / self.fps), self._flush_inval_cb)
+            else:
+                self._inval_id = gobject.idle_add(self._flush_inval_cb)
+
+    def _flush_inval_cb(self):
+        self._inval_id = None
+        self.flush_inval(force=True)
+        return False
+
+    def flush_inval(self, force=False):
+        ''' Queue a redraw of the accumulated region; called at the end of
+        each time slice of the running program. '''
+        self.stroke_path()
+        if self._dirty is None:
+            return
+        # At a fixed frame rate, leave it to the timer
+        if self.fps > 0 and not force:
+            return
+        x1, y1, x2, y2 = self._dirty
+        self._dirty = None
+        self.turtle_window.inval_area(x1, y1, x2 - x1, y2 - y1)
@@ -23,13 +23,11 @@ from dbus.service import signal
 from dbus.gobject_service import ExportedGObject
 import telepathy
 import os
-import gtk
-import tempfile
 
 from gettext import gettext as _
 
-from TurtleArt.tautils import (data_to_string, data_from_string, get_path,
-                               base64_to_image, debug_output, error_output)
+from TurtleArt.tautils import (data_to_string, data_from_string,
+                               base64_to_pixbuf, debug_output, error_output)
 from TurtleArt.taconstants import DEFAULT_TURTLE_COLORS
 
 try:
@@ -303,13 +301,7 @@ class Collaboration():
         if len(payload) > 0:
             [nick, [width, height, data]] = data_from_string(payload)
             if nick != self._tw.nick:
-                if self._tw.running_sugar:
-                    tmp_path = get_path(self._tw.activity, 'instance')
-                else:
-                    tmp_path = tempfile.gettempdir()
-                file_name = base64_to_image(data, tmp_path)
-                pixbuf = gtk.gdk.pixbuf_new_from_file_at_size(file_name,
-                                                              width, height)
+                pixbuf = base64_to_pixbuf(data, width, height)
                 self._tw.turtles.set_turtle(nick)
                 self._tw.turtles.get_active_turtle().set_shapes([pixbuf])
 
@@ -318,16 +310,10 @@ class Collaboration():
             [nick, [a, b, x, y, w, h, width, height, data]] =\
                 data_from_string(payload)
             if nick != self._tw.nick:
-                if self._tw.running_sugar:
-                    tmp_path = get_path(self._tw.activity, 'instance')
-                else:
-                    tmp_path = tempfile.gettempdir()
-                file_name = base64_to_image(data, tmp_path)
-                pixbuf = gtk.gdk.pixbuf_new_from_file_at_size(file_name,
-                                                              width, height)
+                pixbuf = base64_to_pixbuf(data, width, height)
                 pos = self._tw.turtles.turtle_to_screen_coordinates((x, y))
                 self._tw.turtles.get_active_turtle().draw_pixbuf(
-                    pixbuf, a, b, pos[0], pos[1], w, h, file_name, False)
+                    pixbuf, a, b, pos[0], pos[1], w, h, None, False)
 
     def _move_forward(self, payload):
         if len(payload) > 0:
@@ -25,7 +25,8 @@ from random import uniform
 from gettext import gettext as _
 
 # Packaging constants
-SUFFIX = ('.ta', '.tb')
+SUFFIX = ('.ta', '.tb', '.tbz')
+ARCHIVE_SUFFIX = '.tbz'  # compressed projects, see taproject
 MAGICNUMBER = 'TB'
 MIMETYPE = ['application/x-turtle-art', 'application/vnd.turtleblocks']
 
@@ -393,7 +394,7 @@ STATUS_SHAPES = ['status', 'info', 'nostack', 'dupstack', 'noinput',
                  'emptyheap', 'emptybox', 'nomedia', 'nocode', 'overflowerror',
                  'negroot', 'syntaxerror', 'nofile', 'nojournal', 'zerodivide',
                  'notanumber', 'incompatible', 'help', 'print', 'noconnection',
-                 'emptystart']
+                 'emptystart', 'stackoverflow']
 
 # Emulate Sugar toolbar when running from outside of Sugar
 TOOLBAR_SHAPES = ['hideshowoff', 'eraseron', 'run-fastoff',
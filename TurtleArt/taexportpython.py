@@ -95,7 +95,7 @@ _SETUP_CODE_END = """\
 if __name__ == '__main__':
     tw.lc.start_time = time()
     tw.lc.icall(start)
-    gobject.idle_add(tw.lc.doevalstep)
+    tw.lc.start_stepping()
     gtk.main()
 """
 _ACTION_STACK_START = """\
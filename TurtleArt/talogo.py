@@ -50,7 +50,7 @@ from .tatype import (TATypeError, TYPES_NUMERIC)
 from .tautils import (get_pixbuf_from_journal, data_from_file, get_stack_name,
                       movie_media_type, audio_media_type, image_media_type,
                       text_media_type, round_int, debug_output, find_group,
-                      get_path, image_to_base64, data_to_string, data_to_file,
+                      get_path, pixbuf_to_base64, data_to_string, data_to_file,
                       get_load_name, chooser_dialog)
 
 try:
@@ -63,6 +63,30 @@ from gettext import gettext as _
 
 primitive_dictionary = {}  # new block primitives get added here
 
+# Instructions used by the compiled execution mode: each instruction is a
+# tuple (opcode, symbol, argument tokens, jump target, block index)
+_OP_EXEC = 0  # run a single statement through the evaluator
+_OP_LOOP = 1  # enter a repeat/forever block and push its loop controller
+_OP_NEXT = 2  # advance the innermost loop controller or jump out of the loop
+_OP_JUMP = 3  # unconditional jump
+_OP_TEST = 4  # enter an if/ifelse block; jump if the condition is false
+_OP_END = 5  # leave the innermost repeat/forever/if/ifelse block
+_OP_CALL = 6  # call an action stack
+_OP_TAIL = 7  # call an action stack in place of the one running
+
+_COMPILED_LOOPS = ('repeat', 'forever')
+_COMPILED_CALLS = ('stack', 'stack1', 'stack2')
+
+MAX_STACK_DEPTH = 10000  # default for LogoCode.max_stack_depth
+
+# Programs run at the same time take turns, a few steps each
+_MAX_THREADS = 16  # default for LogoCode.max_threads
+_THREAD_QUANTUM = 10  # steps a thread runs before the next one's turn
+# The LogoCode attributes that hold the execution state of a thread
+_THREAD_STATE = ('step', 'istack', 'iline', 'cfun', 'arglist', 'iresult',
+                 'bindex', 'procstop', 'hidden_turtle', '_resume_time',
+                 '_run_compiled', '_run_turbo', '_stack_depth', '_tail_call')
+
 
 class noKeyError(UserDict):
 
@@ -83,6 +107,81 @@ class symbol:
         return '#' + self.name
 
 
+class LineCursor(object):
+
+    """ A read position in a parsed line of code. The line itself is never
+    modified, so loop bodies and action stacks can be run again without
+    copying them. """
+
+    __slots__ = ('line', 'pos')
+
+    def __init__(self, line, pos=0):
+        self.line = line
+        self.pos = pos
+
+    def __len__(self):
+        return len(self.line) - self.pos
+
+    def __getitem__(self, i):
+        """ Look ahead i tokens without consuming anything """
+        if i < 0:
+            raise IndexError(i)
+        return self.line[self.pos + i]
+
+    def pop(self, i=0):
+        """ Consume the next token; i is accepted, as 0 only, so that
+        callers can treat the cursor like the list it replaces """
+        if i != 0:
+            raise ValueError('LineCursor can only pop the next token')
+        token = self.line[self.pos]
+        self.pos += 1
+        return token
+
+    def __repr__(self):
+        return 'LineCursor(%s)' % (repr(self.line[self.pos:]))
+
+
+class _BoundName(object):
+
+    """ The constant name of a box or an action stack in a line of code,
+    with its key in the boxes or stacks dictionary worked out when the line
+    was read (see LogoCode._bind_names) """
+
+    __slots__ = ('name', 'key', 'is_native')
+
+    def __init__(self, name, key, is_native=False):
+        self.name = name
+        self.key = key
+        self.is_native = is_native
+
+    def __repr__(self):
+        return repr(self.name)
+
+
+class _Thread(object):
+
+    """ The execution state of one of the programs run at the same time.
+    LogoCode works on the state of the current thread in its own attributes
+    (see _THREAD_STATE) and keeps a copy here while another thread runs. """
+
+    def __init__(self, turtle=None):
+        self.turtle = turtle  # the active turtle
+        self.step = None
+        self.istack = []
+        self.iline = None
+        self.cfun = None
+        self.arglist = None
+        self.iresult = None
+        self.bindex = None
+        self.procstop = False
+        self.hidden_turtle = None
+        self._resume_time = None
+        self._run_compiled = False
+        self._run_turbo = False
+        self._stack_depth = 0
+        self._tail_call = None
+
+
 class logoerror(Exception):
 
     def __init__(self, value):
@@ -187,9 +286,35 @@ class LogoCode:
         self.boxes = {'box1': 0, 'box2': 0}
         self.return_values = []
         self.heap = []
-        self.iresults = None
+        self.iresult = None
         self.step = None
         self.bindex = None
+        self._thread = _Thread()  # the thread running now
+        self._threads = []  # the threads still running, in turn order
+        self._thread_index = 0  # position of the current thread
+        self.max_threads = _MAX_THREADS
+        self._stack_depth = 0  # action stacks called and not finished
+        self._tail_call = None  # see prim_tail_call
+        # Most action stacks that may run inside each other (tail calls
+        # do not count) before the program stops with #stackoverflow;
+        # the batch renderer and the benchmark set it with --max_depth.
+        self.max_stack_depth = MAX_STACK_DEPTH
+        self._tail_symbols = {}  # call symbol: (its fcn, tail call symbol)
+        self._resume_time = None  # see suspend()
+        self._step_source = None  # main loop source running the program
+        self.blocks_run = 0  # statement blocks run so far (for benchmarks)
+        self.last_error = None  # the logoerror that stopped the program
+        self.profiling = False  # record time spent in each block and stack
+        self.block_profile = {}  # block index: [calls, seconds]
+        self.stack_profile = {}  # action stack name: [calls, seconds]
+        self._heat_map_blocks = []
+        self.compiled = False  # default execution mode for run_blocks()
+        self._run_compiled = False
+        # Don't show progress (highlighting, before/after hooks and value
+        # labels) when running; default for run_blocks()
+        self.turbo = False
+        self._run_turbo = False
+        self._compiled_stacks = {}
 
         self.hidden_turtle = None
 
@@ -208,10 +333,21 @@ class LogoCode:
 
     def stop_logo(self):
         """ Stop logo is called from the Stop button on the toolbar """
+        # Drop the other threads; this one winds up the program
+        for thread in self._threads:
+            if thread is not self._thread and \
+                    thread.hidden_turtle is not None:
+                thread.hidden_turtle.show()
+        self._threads = [self._thread]
+        self._thread_index = 0
         self.step = _just_stop()
         # Clear istack and iline of any code that was not executed due to Stop
         self.istack = []
         self.iline = None
+        self._resume_time = None
+        self._stack_depth = 0
+        self._tail_call = None
+        self._wake()
         self.tw.stop_plugins()
         if self.tw.gst_available:
             from .tagplay import stop_media
@@ -245,11 +381,45 @@ class LogoCode:
         else:
             return None
 
-    def run_blocks(self, code):
+    def run_blocks(self, code, compiled=None, turbo=None, concurrent=False):
         """Run code generated by generate_code().
+        compiled -- run the code as a flat list of instructions instead of
+            through the evaluator (defaults to self.compiled; ignored while
+            profiling)
+        turbo -- skip all the per-block display work, even with the blocks
+            shown (defaults to self.turbo)
+        concurrent -- run the code in a new thread, taking turns with the
+            programs already running, rather than in place of them
+        Returns False if there are already max_threads threads running.
         """
-        self.start_time = time()
+        if concurrent and self._threads:
+            if len(self._threads) >= self.max_threads:
+                debug_output('Too many threads (%d) to run another one' %
+                             (len(self._threads)), self.tw.running_sugar)
+                return False
+            self._switch_thread(len(self._threads), _Thread(
+                self.tw.turtles.get_active_turtle()))
+        else:
+            self.start_time = time()
+            self.last_error = None
+            self._compiled_stacks = {}
+            self._switch_thread(0, _Thread(
+                self.tw.turtles.get_active_turtle()))
+            self._threads = []
+        self._threads.append(self._thread)
+        if compiled is None:
+            compiled = self.compiled
+        if self.profiling:
+            compiled = False  # The profiler hooks into the evaluator
+        self._run_compiled = compiled
+        if turbo is None:
+            turbo = self.turbo
+        self._run_turbo = turbo
+        if turbo:
+            self.update_values = False
+        self._wake()
         self._setup_cmd(code)
+        return True
 
     def generate_code(self, blk, blocks):
         """ Generate code to be passed to run_blocks() from a stack of blocks.
@@ -320,6 +490,10 @@ class LogoCode:
                     self.tw.running_blocks = False
                     return None
 
+        for stack in self.stacks.values():
+            if stack is not None:
+                self._mark_tail_calls(stack)
+
         code = self._blocks_to_code(blk)
 
         if self._save_blocks is not None:
@@ -354,9 +528,9 @@ class LogoCode:
         if len(dock) > 4 and dock[4] in ('[', ']', ']['):
             code.append(dock[4])
         if blk.primitive is not None:  # make a tuple (prim, blk)
-            if blk in self.tw.block_list.list:
-                code.append((blk.primitive,
-                             self.tw.block_list.list.index(blk)))
+            bindex = self.tw.block_list.get_index(blk)
+            if bindex is not None:
+                code.append((blk.primitive, bindex))
             else:
                 code.append(blk.primitive)  # Hidden block
         elif blk.is_value_block():  # Extract the value from content blocks.
@@ -381,6 +555,40 @@ class LogoCode:
                     code.append('%nothing%')
         return code
 
+    def _mark_tail_calls(self, line):
+        """ Replace an action call at the end of the body of an action
+        stack (or at the end of an if or ifelse block there) with a tail
+        call, which runs the called stack in place of the calling one, so
+        that recursion in tail position does not use up more memory. """
+        i = last = 0
+        while i < len(line):
+            last = i
+            i += self._token_extent(line, i)
+        if last >= len(line):
+            return
+        token, bindex = line[last], None
+        if isinstance(token, tuple):
+            (token, bindex) = token
+        args = line[last + 1:]
+        kind = self._flow_kind(token, args)
+        if kind == _OP_TEST:
+            for arg in args[-2:]:
+                if isinstance(arg, list):
+                    self._mark_tail_calls(arg)
+        elif kind == _OP_CALL:
+            (fcn, tail) = self._tail_symbols.get(token, (None, None))
+            if fcn is not token.fcn:
+                tail = symbol(token.name)
+                tail.nargs = token.nargs
+                tail.rprim = False
+                tail.fcn = token.fcn.copy()
+                tail.fcn.func = self.prim_tail_call
+                self._tail_symbols[token] = (token.fcn, tail)
+            if bindex is None:
+                line[last] = tail
+            else:
+                line[last] = (tail, bindex)
+
     def _setup_cmd(self, string):
         """ Execute the psuedocode. """
         self.hidden_turtle = self.tw.turtles.get_active_turtle()
@@ -397,8 +605,10 @@ class LogoCode:
         """
         # debug_output(line, self.tw.running_sugar)
         res = []
-        while line:
-            token = line.pop(0)
+        # Nested lists are read from the same iterator.
+        if not hasattr(line, 'next'):
+            line = iter(line)
+        for token in line:
             bindex = None
             if isinstance(token, tuple):
                 (token, bindex) = token
@@ -417,13 +627,52 @@ class LogoCode:
             elif token == '[':
                 res.append(self._readline(line))
             elif token == ']':
-                return res
+                break
             elif bindex is None or not isinstance(bindex, int):
                 res.append(self._intern(token))
             else:
                 res.append((self._intern(token), bindex))
+        self._bind_names(res)
         return res
 
+    def _name_kind(self, sym):
+        """ 'box' or 'stack' if the first argument of sym is the name of a
+        box or an action stack, otherwise None """
+        fcn = sym.fcn
+        if type(fcn).__name__ != 'Primitive' or not fcn.arg_descs:
+            return None
+        slot = fcn.arg_descs[0]
+        # Names given as constants (e.g., in storeinbox1) are not in the code
+        if type(slot).__name__ != 'ArgSlot' or slot.wrapper is not None:
+            return None
+        if fcn.func in (self.prim_set_box, self.prim_get_box):
+            return 'box'
+        if fcn.func in (self.prim_invoke_stack, self.prim_invoke_return_stack):
+            return 'stack'
+        return None
+
+    def _bind_names(self, line):
+        """ Replace the constant names of boxes and action stacks in a line
+        of code with _BoundNames, so that their keys are not worked out
+        again every time the blocks run. Computed names (e.g., from a join
+        block) are looked up when they are used. """
+        for i in range(len(line) - 1):
+            token = line[i]
+            if isinstance(token, tuple):
+                token = token[0]
+            if not isinstance(token, self.symtype):
+                continue
+            name = line[i + 1]
+            if not isinstance(name, (basestring, int, long, float)) or \
+                    name == '__return__':
+                continue
+            kind = self._name_kind(token)
+            if kind == 'box':
+                (key, is_native) = self._get_box_key(name)
+                line[i + 1] = _BoundName(name, key, is_native)
+            elif kind == 'stack':
+                line[i + 1] = _BoundName(name, self._get_stack_key(name))
+
     def _start_eval(self, blklist):
         """ Step through the list. """
         if self.tw.running_sugar:
@@ -433,8 +682,13 @@ class LogoCode:
         elif self.tw.interactive_mode:
             self.tw.toolbar_shapes['stopiton'].set_layer(TAB_LAYER)
         self.running = True
-        self.icall(self.evline, blklist)
+        if self._run_compiled:
+            self.icall(self._run_code, self._compile_line(blklist))
+        else:
+            self.icall(self.evline, blklist)
         yield True
+        if len(self._threads) > 1:
+            return  # The last thread to finish winds up the program
         if self.tw.running_sugar:
             if self.tw.step_time == 0 and self.tw.selected_blk is None:
                 self.tw.activity.stop_turtle_button.set_icon("hideshowon")
@@ -462,7 +716,7 @@ class LogoCode:
     def evline(self, blklist, call_me=True):
         """ Evaluate a line of code from the list. """
         oldiline = self.iline
-        self.iline = blklist[:]
+        self.iline = LineCursor(blklist)
         self.arglist = None
         while self.iline:
             token = self.iline[0]
@@ -471,28 +725,13 @@ class LogoCode:
                 (token, self.bindex) = self.iline[0]
 
             if self.bindex is not None:
-                current_block = self.tw.block_list.list[self.bindex]
-                # If the blocks are visible, highlight the current block.
-                if not self.tw.hide:
-                    current_block.highlight()
-                # Anything we need to do specific for this block
-                # before it is run?
-                if current_block.before is not None:
-                    current_block.before(self.tw, current_block)
-
-            if not self.tw.hide and self.bindex is not None:
-                current_block = self.tw.block_list.list[self.bindex]
-                current_block.highlight()
-                if current_block.before is not None:
-                    current_block.before(current_block)
+                self._enter_block(self.bindex)
 
             # In debugging modes, we pause between steps and show the turtle.
             if self.tw.step_time > 0:
                 self.tw.turtles.get_active_turtle().show()
-                endtime = _millisecond() + self.tw.step_time * 100.
-                while _millisecond() < endtime:
-                    sleep(0.1)
-                    yield True
+                self.suspend(self.tw.step_time / 10.)
+                yield True
                 self.tw.turtles.get_active_turtle().hide()
 
             # 'Stand-alone' booleans are handled here.
@@ -502,18 +741,17 @@ class LogoCode:
                     (token, self.bindex) = self.iline[1]
 
             # Process the token and any arguments.
+            bindex = self.bindex
+            if self.profiling and bindex is not None:
+                starttime = time()
             self.icall(self._eval, call_me)
             yield True
+            if self.profiling and bindex is not None:
+                self._add_to_profile(self.block_profile, bindex,
+                                     time() - starttime)
 
             if self.bindex is not None:
-                current_block = self.tw.block_list.list[self.bindex]
-                # Time to unhighlight the current block.
-                if not self.tw.hide:
-                    current_block.unhighlight()
-                # Anything we need to do specific for this block
-                # after it is run?
-                if current_block.after is not None:
-                    current_block.after(self.tw, current_block)
+                self._leave_block(self.bindex)
 
             if self.procstop:
                 break
@@ -541,12 +779,14 @@ class LogoCode:
         # Either we are processing a symbol or a value.
         if isinstance(token, self.symtype):
             # We highlight blocks here in case an error occurs...
-            if not self.tw.hide and bindex is not None:
+            show = bindex is not None and not self._run_turbo and \
+                not self.tw.hide
+            if show:
                 self.tw.block_list.list[bindex].highlight()
             self.icall(self._evalsym, token, call_me)
             yield True
             # and unhighlight if everything was OK.
-            if not self.tw.hide and bindex is not None:
+            if show:
                 self.tw.block_list.list[bindex].unhighlight()
             res = self.iresult
         else:
@@ -614,15 +854,143 @@ class LogoCode:
         self.ijmp(self.evline, body, call_me)
         yield True
 
+    def suspend(self, seconds):
+        """ Pause the running program for some seconds, from the next time
+        the calling generator yields. The time slice ends there and the
+        main loop carries on until the program is due to resume. """
+        if seconds > 0:
+            self._resume_time = time() + seconds
+
+    def get_wait_time(self):
+        """ Seconds until a suspended program resumes (0 if it is not
+        suspended, or if any of its threads can run) """
+        resume_time = None
+        for thread in self._threads:
+            if thread is self._thread:
+                thread_resume_time = self._resume_time
+            else:
+                thread_resume_time = thread._resume_time
+            if thread_resume_time is None:
+                return 0
+            if resume_time is None or thread_resume_time < resume_time:
+                resume_time = thread_resume_time
+        if resume_time is None:
+            return 0
+        return max(resume_time - time(), 0)
+
+    def _wake(self):
+        """ Run the next time slice as soon as the main loop is idle,
+        rather than when a suspended thread is due to resume """
+        if self._step_source is not None:
+            gobject.source_remove(self._step_source)
+            self._step_source = gobject.idle_add(self._step_cb)
+
+    def start_stepping(self):
+        """ Run the program from the gobject main loop: a time slice
+        whenever the main loop is idle or, while the program is suspended,
+        from a timeout when it is due to resume. """
+        if self._step_source is None:
+            self._step_source = gobject.idle_add(self._step_cb)
+
+    def _step_cb(self):
+        self._step_source = None
+        if not self.doevalstep():
+            return False
+        wait_time = self.get_wait_time()
+        if wait_time > 0:
+            self._step_source = gobject.timeout_add(
+                int(wait_time * 1000) + 1, self._step_cb)
+        else:
+            self._step_source = gobject.idle_add(self._step_cb)
+        return False
+
+    def sleep_until_resume(self, limit=None):
+        """ Without a main loop (e.g., in batch mode) nothing else can run
+        while the program is suspended: sleep until it resumes, or for at
+        most limit seconds. """
+        wait_time = self.get_wait_time()
+        if limit is not None:
+            wait_time = min(wait_time, limit)
+        if wait_time > 0:
+            sleep(wait_time)
+
     def doevalstep(self):
         """ evaluate one step """
+        try:
+            return self._doevalslice()
+        finally:
+            # Finish the lines drawn during this time slice and refresh them
+            self.tw.canvas.flush_inval()
+
+    def _save_thread(self):
+        """ Copy the state of the current thread to its _Thread """
+        thread = self._thread
+        for name in _THREAD_STATE:
+            setattr(thread, name, getattr(self, name))
+        thread.turtle = self.tw.turtles.get_active_turtle()
+
+    def _switch_thread(self, index, thread):
+        """ Make thread (at index in the turn order) the current thread """
+        self._thread_index = index
+        if thread is self._thread:
+            return
+        self._save_thread()
+        self._thread = thread
+        for name in _THREAD_STATE:
+            setattr(self, name, getattr(thread, name))
+        if thread.turtle is not None and \
+                thread.turtle is not self.tw.turtles.get_active_turtle():
+            self.tw.turtles.set_active_turtle(thread.turtle)
+            # The pen is kept by the canvas, which all the turtles share
+            thread.turtle.set_color(share=False)
+            thread.turtle.set_pen_size(share=False)
+
+    def _next_thread(self):
+        """ Switch to the next thread in turn that is not suspended;
+        returns False if there is none """
+        count = len(self._threads)
+        if count == 1:
+            # No one else to take turns with
+            self._switch_thread(0, self._threads[0])
+            return self._resume_time is None or self.get_wait_time() == 0
+        now = time()
+        for i in range(1, count + 1):
+            index = (self._thread_index + i) % count
+            thread = self._threads[index]
+            if thread is self._thread:
+                resume_time = self._resume_time
+            else:
+                resume_time = thread._resume_time
+            if resume_time is None or resume_time <= now:
+                self._switch_thread(index, thread)
+                return True
+        return False
+
+    def _end_thread(self):
+        """ Remove the current thread, which has finished """
+        del self._threads[self._thread_index]
+        # The next thread in turn is at the same index now
+        self._thread_index -= 1
+        self.step = None
+
+    def _doevalslice(self):
+        """ evaluate for one time slice, during which the threads take
+        turns of _THREAD_QUANTUM steps """
         starttime = _millisecond()
+        steps = _THREAD_QUANTUM
         try:
             while (_millisecond() - starttime) < 120:
                 try:
-                    if self.step is None:
-                        self.tw.running_blocks = False
-                        return False
+                    if steps >= _THREAD_QUANTUM or self.step is None or \
+                            self._resume_time is not None:
+                        if not self._threads:
+                            self.tw.running_blocks = False
+                            return False
+                        if not self._next_thread():
+                            return True  # They are all suspended
+                        self._resume_time = None
+                        steps = 0
+                    steps += 1
                     if self.tw.running_turtleart:
                         try:
                             self.step.next()
@@ -673,12 +1041,20 @@ class LogoCode:
                             self.hidden_turtle = None
                         else:
                             self.tw.turtles.get_active_turtle().show()
-                        self.tw.running_blocks = False
-                        return False
+                        self._end_thread()
+                        if not self._threads:
+                            self.tw.running_blocks = False
+                            return False
                     else:
                         self.ireturn()
         except logoerror as e:
+            # An error in any thread stops the program
+            self._threads = []
+            self.last_error = str(e)
             if self.tw.running_turtleart:
+                if self._run_turbo and self.bindex is not None:
+                    # Show where the error is, as _eval would have
+                    self.tw.block_list.list[self.bindex].highlight()
                 self.tw.showblocks()
                 self.tw.display_coordinates()
                 self.tw.showlabel('syntaxerror', str(e))
@@ -699,6 +1075,324 @@ class LogoCode:
         """ ijmp """
         self.step = fcn(*(args))
 
+    #
+    # Profiling
+    #
+
+    def _add_to_profile(self, profile, key, seconds):
+        """ Count one more call taking seconds """
+        if key in profile:
+            profile[key][0] += 1
+            profile[key][1] += seconds
+        else:
+            profile[key] = [1, seconds]
+
+    def reset_profile(self):
+        """ Forget the times recorded by the profiler """
+        self.block_profile = {}
+        self.stack_profile = {}
+
+    def get_profile(self):
+        """ The profile as (seconds, calls, description) tuples, slowest
+        first. The time of a block includes the blocks it runs (e.g., the
+        contents of a repeat) and the time it spends waiting. """
+        profile = []
+        for bindex, (calls, seconds) in self.block_profile.items():
+            if bindex < len(self.tw.block_list.list):
+                blk = self.tw.block_list.list[bindex]
+                description = '%s #%d' % (blk.name, bindex)
+            else:
+                description = '#%d' % (bindex)
+            profile.append((seconds, calls, description))
+        for name, (calls, seconds) in self.stack_profile.items():
+            profile.append((seconds, calls, '%s %s' % (_('action'), name)))
+        profile.sort(reverse=True)
+        return profile
+
+    def get_profile_report(self, limit=None):
+        """ The profile as text, one line per block or action stack """
+        lines = ['%10s %8s  %s' % (_('seconds'), _('calls'), _('block'))]
+        for seconds, calls, description in self.get_profile()[:limit]:
+            lines.append('%10.4f %8d  %s' % (seconds, calls, description))
+        return '\n'.join(lines)
+
+    def show_profile_heat_map(self):
+        """ Tint the profiled blocks from yellow (cool) to red (hot) """
+        self.hide_profile_heat_map()
+        if not self.block_profile:
+            return
+        hottest = max([seconds for calls, seconds in
+                       self.block_profile.values()]) or 1
+        for bindex, (calls, seconds) in self.block_profile.items():
+            if bindex >= len(self.tw.block_list.list):
+                continue
+            blk = self.tw.block_list.list[bindex]
+            heat = seconds / hottest
+            green = int(255 * (1 - heat))
+            blk.set_tint(['#FF%02X00' % (green),
+                          '#A0%02X00' % (int(green * 0.6))])
+            self._heat_map_blocks.append(blk)
+
+    def hide_profile_heat_map(self):
+        """ Restore the colors of the blocks tinted by the heat map """
+        for blk in self._heat_map_blocks:
+            blk.clear_tint()
+        self._heat_map_blocks = []
+
+    #
+    # Compiled execution
+    #
+
+    def _token_extent(self, line, i):
+        """ Number of tokens used by the expression starting at line[i] """
+        if i >= len(line):
+            return 0
+        token = line[i]
+        if isinstance(token, tuple):
+            token = token[0]
+        if not isinstance(token, self.symtype):
+            return 1
+        n = 1
+        if token.nargs is not None:
+            for j in range(token.nargs):
+                n += self._token_extent(line, i + n)
+        if token is self.symopar:  # skip the closing parenthesis
+            n += 1
+        return n
+
+    def _flow_kind(self, token, args):
+        """ Which kind of instruction should this statement compile to? Loop
+        and conditional bodies must be lists. """
+        if not isinstance(token, self.symtype) or \
+                type(token.fcn).__name__ != 'Primitive':
+            return None
+        if token.fcn.func == self.prim_tail_call:
+            return _OP_TAIL
+        if not token.rprim:
+            return None
+        bodies = [arg for arg in args[-2:] if isinstance(arg, list)]
+        if token.name in _COMPILED_LOOPS and args and \
+                isinstance(args[-1], list):
+            return _OP_LOOP
+        elif token.name == 'if' and args and isinstance(args[-1], list):
+            return _OP_TEST
+        elif token.name == 'ifelse' and len(bodies) == 2:
+            return _OP_TEST
+        elif token.name in _COMPILED_CALLS:
+            return _OP_CALL
+        return None
+
+    def _compile_line(self, line, code=None):
+        """ Convert a line of code (as returned by _readline) into a flat
+        list of instructions. Loops, conditionals and action calls become
+        jumps; all other statements are left to the evaluator. """
+        if code is None:
+            code = []
+        i = 0
+        while i < len(line):
+            n = self._token_extent(line, i)
+            statement = line[i:i + n]
+            i += n
+            token, bindex = statement[0], None
+            if isinstance(token, tuple):
+                (token, bindex) = token
+            args = statement[1:]
+            kind = self._flow_kind(token, args)
+            if kind == _OP_LOOP:
+                code.append((_OP_LOOP, token, args, None, bindex))
+                top = len(code)
+                code.append(None)  # filled in below
+                self._compile_line(args[-1], code)
+                code.append((_OP_JUMP, None, None, top, None))
+                code[top] = (_OP_NEXT, None, None, len(code), None)
+                code.append((_OP_END, None, None, None, None))
+            elif kind == _OP_TEST and token.name == 'if':
+                test = len(code)
+                code.append(None)
+                self._compile_line(args[-1], code)
+                code[test] = (_OP_TEST, token, args, len(code), bindex)
+                code.append((_OP_END, None, None, None, None))
+            elif kind == _OP_TEST:  # ifelse
+                test = len(code)
+                code.append(None)
+                self._compile_line(args[-2], code)
+                jump = len(code)
+                code.append(None)
+                code[test] = (_OP_TEST, token, args, len(code), bindex)
+                self._compile_line(args[-1], code)
+                code[jump] = (_OP_JUMP, None, None, len(code), None)
+                code.append((_OP_END, None, None, None, None))
+            elif kind in (_OP_CALL, _OP_TAIL):
+                code.append((kind, token, args, None, bindex))
+            else:
+                code.append((_OP_EXEC, token, args, None, bindex))
+        return code
+
+    def _compile_stack(self, key):
+        """ Return the compiled code of an action stack """
+        stack = self.stacks[key]
+        if key in self._compiled_stacks:
+            (line, code) = self._compiled_stacks[key]
+            if line is stack:
+                return code
+        code = self._compile_line(stack)
+        self._compiled_stacks[key] = (stack, code)
+        return code
+
+    def _enter_block(self, bindex):
+        """ Highlight a block and run its before hook """
+        self.bindex = bindex
+        if bindex is None:
+            return
+        self.blocks_run += 1
+        if self._run_turbo:
+            return
+        current_block = self.tw.block_list.list[bindex]
+        if not self.tw.hide:
+            current_block.highlight()
+        if current_block.before is not None:
+            current_block.before(self.tw, current_block)
+
+    def _leave_block(self, bindex):
+        """ Unhighlight a block and run its after hook """
+        if bindex is None or self._run_turbo:
+            return
+        current_block = self.tw.block_list.list[bindex]
+        if not self.tw.hide:
+            current_block.unhighlight()
+        if current_block.after is not None:
+            current_block.after(self.tw, current_block)
+
+    def _run_code(self, code):
+        """ Run a list of instructions generated by _compile_line. The
+        evaluator is only used for the statements and arguments themselves,
+        so there is one generator per statement rather than one per block
+        and loop iteration. """
+        oldiline = self.iline
+        self.arglist = None
+        frames = []  # calling action stacks: (code, pc, blocks, bindex)
+        blocks = []  # open loops and conditionals: [bindex, controller]
+        caller = None
+        pc = 0
+        while True:
+            if pc >= len(code) or self.procstop:
+                # Leave the current action stack.
+                while blocks:
+                    self._leave_block(blocks.pop()[0])
+                if not frames:
+                    break
+                self.procstop = False
+                self._leave_block(caller)
+                (code, pc, blocks, caller) = frames.pop()
+                self._stack_depth -= 1
+                yield True
+                continue
+
+            (op, token, args, target, bindex) = code[pc]
+            pc += 1
+            if op == _OP_JUMP:
+                pc = target
+                continue
+            if op == _OP_NEXT:
+                if not next(blocks[-1][1]):
+                    pc = target
+                yield True
+                continue
+            if op == _OP_END:
+                self._leave_block(blocks.pop()[0])
+                continue
+
+            self._enter_block(bindex)
+
+            # In debugging modes, we pause between steps and show the turtle.
+            if self.tw.step_time > 0:
+                self.tw.turtles.get_active_turtle().show()
+                self.suspend(self.tw.step_time / 10.)
+                yield True
+                self.tw.turtles.get_active_turtle().hide()
+
+            if op == _OP_EXEC and (not isinstance(token, self.symtype) or
+                                   token.rprim or token.fcn is None or
+                                   token.nargs is None):
+                if isinstance(token, self.symtype):
+                    self.iline = LineCursor(args)
+                    self.icall(self._evalsym, token, True)
+                    yield True
+                else:
+                    self.iresult = token
+
+            else:
+                # Evaluate the arguments the same way _evalsym does, but
+                # without a generator for constant arguments.
+                self.iline = LineCursor(args)
+                self.cfun, self.arglist = token, []
+                call_args = type(token.fcn).__name__ not in (
+                    'Primitive', 'PrimitiveDisjunction')
+                for i in range(token.nargs):
+                    self._no_args_check()
+                    arg = self.iline[0]
+                    if isinstance(arg, (tuple, self.symtype)):
+                        self.icall(self._eval, call_args)
+                        yield True
+                        self.arglist.append(self.iresult)
+                    else:
+                        self.arglist.append(self.iline.pop(0))
+                if op == _OP_EXEC:
+                    self.iresult = token.fcn(self, *self.arglist)
+                    self.arglist = None
+
+            if op == _OP_EXEC:
+                self._leave_block(bindex)
+                if self.procstop:
+                    continue
+                if self.iresult is None:
+                    continue
+                if bindex is not None:
+                    self.tw.block_list.list[bindex].highlight()
+                self.tw.showblocks()
+                self.tw.display_coordinates()
+                raise logoerror(str(self.iresult))
+
+            # Let the primitive check and convert its arguments.
+            new_prim = token.fcn.fill_slots(self.arglist, convert_to_ast=False)
+            self.arglist = None
+            if not new_prim.are_slots_filled():
+                raise logoerror("#syntaxerror")
+            values = new_prim.get_values_of_filled_slots()[0]
+
+            if op == _OP_LOOP:
+                controller = values[0]
+                if not hasattr(controller, "next"):
+                    controller = controller()
+                blocks.append([bindex, controller])
+            elif op == _OP_TEST:
+                blocks.append([bindex, None])
+                if not values[0]:
+                    pc = target
+            elif op in (_OP_CALL, _OP_TAIL):
+                key = self._get_stack_key(values[0])
+                if self.stacks.get(key) is None:
+                    raise logoerror("#nostack")
+                if op == _OP_TAIL and frames:
+                    # Nothing is left to do in this stack
+                    while blocks:
+                        self._leave_block(blocks.pop()[0])
+                    self._leave_block(caller)
+                else:
+                    self._push_stack()
+                    frames.append((code, pc, blocks, caller))
+                code = self._compile_stack(key)
+                pc = 0
+                blocks = []
+                caller = bindex
+            yield True
+
+        self.iline = oldiline
+        self.ireturn()
+        if not self.tw.hide and self.tw.step_time > 0:
+            self.tw.display_coordinates()
+        yield True
+
     def _undefined_check(self, token):
         """ Make sure token has a definition """
         if token.fcn is not None:
@@ -780,7 +1474,7 @@ class LogoCode:
                 raise TypeError("a loop controller must be either an iterator "
                                 "or a callable that returns an iterator")
         while next(controller):
-            self.icall(self.evline, blklist[:])
+            self.icall(self.evline, blklist)
             yield True
             if self.procstop:
                 break
@@ -789,7 +1483,7 @@ class LogoCode:
 
     def prim_clamp(self, blklist):
         """ Run clamp blklist """
-        self.icall(self.evline, blklist[:])
+        self.icall(self.evline, blklist)
         yield True
         self.procstop = False
         self.ireturn()
@@ -824,10 +1518,8 @@ class LogoCode:
     def prim_wait(self, wait_time):
         """ Show the turtle while we wait """
         self.tw.turtles.get_active_turtle().show()
-        endtime = _millisecond() + wait_time * 1000.
-        while _millisecond() < endtime:
-            sleep(wait_time / 10.)
-            yield True
+        self.suspend(wait_time)
+        yield True
         self.tw.turtles.get_active_turtle().hide()
         self.ireturn()
         yield True
@@ -835,7 +1527,7 @@ class LogoCode:
     def prim_if(self, boolean, blklist):
         """ If bool, do list """
         if boolean:
-            self.icall(self.evline, blklist[:])
+            self.icall(self.evline, blklist)
             yield True
         self.ireturn()
         yield True
@@ -843,21 +1535,22 @@ class LogoCode:
     def prim_ifelse(self, boolean, list1, list2):
         """ If bool, do list1, else do list2 """
         if boolean:
-            self.ijmp(self.evline, list1[:])
+            self.ijmp(self.evline, list1)
             yield True
         else:
-            self.ijmp(self.evline, list2[:])
+            self.ijmp(self.evline, list2)
             yield True
 
     def prim_set_box(self, name, value):
         """ Store value in named box """
         (key, is_native) = self._get_box_key(name)
         self.boxes[key] = value
-        if is_native:
-            if self.update_values:
+        if self.update_values:
+            if isinstance(name, _BoundName):
+                name = name.name
+            if is_native:
                 self.update_label_value(name, value)
-        else:
-            if self.update_values:
+            else:
                 self.update_label_value('box', value, label=name)
 
     def prim_get_box(self, name):
@@ -877,6 +1570,8 @@ class LogoCode:
     def _get_box_key(self, name):
         """ Return the key used for this box in the boxes dictionary and a
         boolean indicating whether it is a 'native' box """
+        if isinstance(name, _BoundName):
+            return (name.key, name.is_native)
         if name in ('box1', 'box2'):
             return (name, True)
         # elif name == '__return__':
@@ -899,12 +1594,44 @@ class LogoCode:
         key = self._get_stack_key(name)
         if self.stacks.get(key) is None:
             raise logoerror("#nostack")
-        self.icall(self.evline, self.stacks[key][:])
-        yield True
-        self.procstop = False
+        self._push_stack()
+        while key is not None:
+            if self.profiling:
+                starttime = time()
+            self.icall(self.evline, self.stacks[key])
+            yield True
+            if self.profiling:
+                if isinstance(name, _BoundName):
+                    name = name.name
+                self._add_to_profile(self.stack_profile, name,
+                                     time() - starttime)
+            self.procstop = False
+            # A tail call runs the next stack here, in place of this one
+            if self._tail_call is None:
+                key = None
+            else:
+                (key, name) = self._tail_call
+                self._tail_call = None
+        self._stack_depth -= 1
         self.ireturn()
         yield True
 
+    def prim_tail_call(self, name):
+        """ Stop the current stack, so that prim_invoke_stack runs the
+        named stack in its place (see _mark_tail_calls) """
+        key = self._get_stack_key(name)
+        if self.stacks.get(key) is None:
+            raise logoerror("#nostack")
+        self._tail_call = (key, name)
+        self.procstop = True
+
+    def _push_stack(self):
+        """ Count a call to an action stack; no more than max_stack_depth
+        stacks may be running at once """
+        if self._stack_depth >= self.max_stack_depth:
+            raise logoerror("#stackoverflow")
+        self._stack_depth += 1
+
     def prim_invoke_return_stack(self, name):
         """ Process a named stack and return a value"""
         self.prim_invoke_stack(name)
@@ -912,6 +1639,8 @@ class LogoCode:
 
     def _get_stack_key(self, name):
         """ Return the key used for this stack in the stacks dictionary """
+        if isinstance(name, _BoundName):
+            return name.key
         if name in ('stack1', 'stack2'):
             return name
         else:
@@ -1159,14 +1888,7 @@ class LogoCode:
                 self.tw.turtles.get_active_turtle().set_pen_state(True)
 
         if self.tw.sharing():
-            if self.tw.running_sugar:
-                tmp_path = get_path(self.tw.activity, 'instance')
-            else:
-                tmp_path = tempfile.gettempdir()
-            tmp_file = os.path.join(get_path(self.tw.activity, 'instance'),
-                                    'tmpfile.png')
-            pixbuf.save(tmp_file, 'png', {'quality': '100'})
-            data = image_to_base64(tmp_file, tmp_path)
+            data = pixbuf_to_base64(pixbuf)
             height = pixbuf.get_height()
             width = pixbuf.get_width()
             event = 'R|%s' % (data_to_string([self.tw.nick,
@@ -1174,7 +1896,6 @@ class LogoCode:
                                                round_int(height),
                                                data]]))
             gobject.idle_add(self.tw.send_event, event)
-            os.remove(tmp_file)
 
     def get_from_url(self, url):
         """ Get contents of URL as text or tempfile to image """
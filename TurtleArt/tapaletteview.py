@@ -30,7 +30,7 @@ from .tapalette import (palette_names, palette_blocks, hidden_proto_blocks,
 from .taconstants import (PALETTE_SCALE, ICON_SIZE, PYTHON_SKIN, XO1,
                           HORIZONTAL_PALETTE, PALETTE_WIDTH, PALETTE_HEIGHT,
                           CATEGORY_LAYER, TOP_LAYER, PROTO_LAYER)
-from .tasprite_factory import SVG, svg_str_to_pixbuf
+from .tasprite_factory import SVG
 from .sprites import Sprite
 
 
@@ -282,7 +282,7 @@ class PaletteView():
 
                 svg = SVG()
                 self.backgrounds[orientation].set_shape(
-                    svg_str_to_pixbuf(svg.palette(w, h)))
+                    svg.to_surface(svg.palette, w, h))
 
     def _make_background(self, x, y, w, h, regenerate=False):
         ''' Make the background sprite for the palette. '''
@@ -296,7 +296,7 @@ class PaletteView():
             svg = SVG()
             self.backgrounds[orientation] = \
                 Sprite(self._turtle_window.sprite_list, x, y,
-                       svg_str_to_pixbuf(svg.palette(w, h)))
+                       svg.to_surface(svg.palette, w, h))
             self.backgrounds[orientation].save_xy = (x, y)
 
             self._float_palette(self.backgrounds[orientation])
@@ -34,6 +34,7 @@ from .tacanvas import TurtleGraphics
 from .taconstants import (Color, CONSTANTS, ColorObj, Vector)
 from .talogo import (LogoCode, logoerror, NegativeRootError)
 from .taturtle import (Turtle, Turtles)
+from TurtleArt import tatype
 from TurtleArt.tatype import (TYPE_CHAR, TYPE_INT, TYPE_FLOAT, TYPE_OBJECT,
                               TYPE_MEDIA, TYPE_COLOR, BOX_AST, ACTION_AST,
                               TYPE_VECTOR,
@@ -45,6 +46,9 @@ from .tautils import debug_output
 from .tawindow import (TurtleArtWindow, global_objects, plugins_in_use)
 from util import ast_extensions
 
+# Maximum number of argument type signatures remembered per Primitive
+_DISPATCH_CACHE_SIZE = 64
+
 
 class PyExportError(BaseException):
 
@@ -112,6 +116,10 @@ class Primitive(object):
         self.call_afterwards = call_afterwards
         self.export_me = export_me
 
+        # argument type signature -> how to fill the slots (see _dispatch)
+        self._dispatch_cache = {}
+        self._dispatch_generation = tatype.converter_generation
+
     def copy(self):
         """ Return a Primitive object with the same attributes as this one.
         Shallow-copy the arg_descs and kwarg_descs attributes. """
@@ -281,19 +289,32 @@ class Primitive(object):
         if Primitive._DEBUG:
             debug_output(repr(self))
             debug_output("  runtime_args: " + repr(runtime_args))
-        # fill the ArgSlots with the runtime arguments
-        new_prim = self.fill_slots(runtime_args, runtime_kwargs,
-                                   convert_to_ast=False)
-        if not new_prim.are_slots_filled():
-            raise logoerror("#syntaxerror")
-        if Primitive._DEBUG:
-            debug_output("  new_prim.arg_descs: " + repr(new_prim.arg_descs))
+            values = None
+        elif runtime_kwargs:
+            values = None
+        elif not runtime_args and self.are_slots_filled():
+            values = self.get_values_of_filled_slots()
+        else:
+            values = self._dispatch(runtime_args)
 
-        # extract the actual values from the (now constant) arguments
-        (new_args, new_kwargs) = new_prim.get_values_of_filled_slots()
-        if Primitive._DEBUG:
-            debug_output("  new_args: " + repr(new_args))
-            debug_output("end " + repr(self))
+        if values is not None:
+            (new_args, new_kwargs) = values
+            new_prim = self
+        else:
+            # fill the ArgSlots with the runtime arguments
+            new_prim = self.fill_slots(runtime_args, runtime_kwargs,
+                                       convert_to_ast=False)
+            if not new_prim.are_slots_filled():
+                raise logoerror("#syntaxerror")
+            if Primitive._DEBUG:
+                debug_output("  new_prim.arg_descs: " +
+                             repr(new_prim.arg_descs))
+
+            # extract the actual values from the (now constant) arguments
+            (new_args, new_kwargs) = new_prim.get_values_of_filled_slots()
+            if Primitive._DEBUG:
+                debug_output("  new_args: " + repr(new_args))
+                debug_output("end " + repr(self))
 
         # what does this primitive want as its first argument?
         first_arg = None
@@ -326,6 +347,120 @@ class Primitive(object):
 
         return return_value
 
+    def _dispatch(self, arguments):
+        """ Fast path for __call__: fill the argument slots following the
+        plan cached for the types of the runtime arguments (an argument
+        that is a Primitive call counts as the Primitive). Return the
+        argument values and keyword argument values like
+        get_values_of_filled_slots, or None if fill_slots must be used. """
+        signature = []
+        for argument in arguments:
+            if (isinstance(argument, tuple) and argument
+                    and callable(argument[0])):
+                if type(argument[0]) is not Primitive:
+                    return None
+                signature.append(argument[0])
+            elif callable(argument) or isinstance(argument, ast.AST):
+                return None
+            else:
+                signature.append(get_type(argument)[0])
+        signature = tuple(signature)
+
+        if self._dispatch_generation != tatype.converter_generation:
+            # the plans refer to converters that may have changed
+            self._dispatch_cache.clear()
+            self._dispatch_generation = tatype.converter_generation
+        if signature in self._dispatch_cache:
+            plan = self._dispatch_cache[signature]
+        else:
+            if len(self._dispatch_cache) >= _DISPATCH_CACHE_SIZE:
+                self._dispatch_cache.clear()
+            plan = self._make_dispatch_plan(signature)
+            self._dispatch_cache[signature] = plan
+        if plan is None:
+            return None
+
+        (slot_plans, kwargs, alternatives) = plan
+        new_args = []
+        try:
+            for slot_plan in slot_plans:
+                if isinstance(slot_plan, ConstantArg):
+                    new_args.append(slot_plan.get())
+                    continue
+                (i, new_type, old_type, converter, call_arg) = slot_plan
+                value = arguments[i]
+                if not call_arg:
+                    new_args.append(value)
+                    continue
+                if isinstance(signature[i], Primitive):
+                    # call the argument, as in ArgSlot.fill
+                    value = value[0](*value[1:])
+                value = convert(value, new_type, old_type=old_type,
+                                converter=converter)
+                if callable(value):
+                    value = value()
+                new_args.append(value)
+        except TATypeError:
+            if alternatives:
+                # another list of slots may fit these values
+                return None
+            raise
+        new_kwargs = {}
+        for key in kwargs:
+            new_kwargs[key] = kwargs[key].get()
+        return (new_args, new_kwargs)
+
+    def _make_dispatch_plan(self, signature):
+        """ Work out how fill_slots would fill the slots for arguments of
+        the given types: choose the list of slots and the converter for
+        each argument. Return None if only fill_slots can do it (argument
+        wrappers, slot disjunctions, uncalled Primitives, or a type
+        error that fill_slots should report). """
+        for key in self.kwarg_descs:
+            if isinstance(self.kwarg_descs[key], ArgSlot):
+                return None
+        if isinstance(self.arg_descs, ArgListDisjunction):
+            slot_list_alternatives = list(self.arg_descs)
+        else:
+            slot_list_alternatives = [self.arg_descs]
+
+        for slot_list in slot_list_alternatives:
+            slot_plans = []
+            i = 0
+            for slot in slot_list:
+                if not isinstance(slot, ArgSlot):
+                    slot_plans.append(slot)
+                    continue
+                if (i >= len(signature) or slot.wrapper is not None or
+                        isinstance(slot, ArgSlotDisjunction)):
+                    return None
+                arg_type = signature[i]
+                if isinstance(arg_type, Primitive):
+                    if not slot.call_arg:
+                        return None
+                    if arg_type.__name__ == '<lambda>':
+                        (converter, old_type, new_type) = \
+                            (identity, TYPE_OBJECT, slot.type)
+                    else:
+                        (converter, old_type, new_type) = _find_converter(
+                            get_type(arg_type)[0], slot.type)
+                else:
+                    (converter, old_type, new_type) = _find_converter(
+                        arg_type, slot.type)
+                if converter is None:
+                    break
+                if not slot.call_arg and converter != identity:
+                    return None
+                slot_plans.append((i, new_type, old_type, converter,
+                                   slot.call_arg))
+                i += 1
+            else:
+                if i != len(signature):
+                    return None
+                return (slot_plans, self.kwarg_descs.copy(),
+                        len(slot_list_alternatives) > 1)
+        return None
+
     def get_ast(self, *arg_asts, **kwarg_asts):
         """Transform this object into a Python AST. When serialized and
         executed, the AST will do exactly the same as calling this
@@ -434,7 +569,8 @@ class Primitive(object):
 
         # sleep/ wait
         elif self == LogoCode.prim_wait:
-            return [get_call_ast('sleep', new_arg_asts), ast_yield_true()]
+            return [get_call_ast('logo.suspend', new_arg_asts),
+                    ast_yield_true()]
 
         # standard operators
         elif self.func.__name__ in Primitive.STANDARD_OPERATORS:
@@ -1006,20 +1142,8 @@ class ArgSlot(object):
                         else:
                             arg_types = get_type(argument)[0]
                             bad_value = argument
-                        converter = None
-                        if not isinstance(arg_types, TypeDisjunction):
-                            arg_types = TypeDisjunction((arg_types, ))
-                        if isinstance(slot.type, TypeDisjunction):
-                            slot_types = slot.type
-                        else:
-                            slot_types = TypeDisjunction((slot.type, ))
-                        for old_type in arg_types:
-                            for new_type in slot_types:
-                                converter = get_converter(old_type, new_type)
-                                if converter is not None:
-                                    break
-                            if converter is not None:
-                                break
+                        (converter, old_type, new_type) = _find_converter(
+                            arg_types, slot.type)
                         # unable to convert, try next wrapper/ slot/ func
                         if converter is None:
                             continue
@@ -1114,6 +1238,26 @@ class ArgSlot(object):
                               req_type=new_type)
 
 
+def _find_converter(arg_types, slot_type):
+    """ Return the first converter found from one of arg_types to one of
+    the slot types, with the types it converts between, as a tuple
+    (converter, old_type, new_type). The converter is None if there is
+    none (and the types are the last ones tried). """
+    converter = None
+    if not isinstance(arg_types, TypeDisjunction):
+        arg_types = TypeDisjunction((arg_types, ))
+    if isinstance(slot_type, TypeDisjunction):
+        slot_types = slot_type
+    else:
+        slot_types = TypeDisjunction((slot_type, ))
+    for old_type in arg_types:
+        for new_type in slot_types:
+            converter = get_converter(old_type, new_type)
+            if converter is not None:
+                return (converter, old_type, new_type)
+    return (converter, old_type, new_type)
+
+
 class ArgSlotDisjunction(Disjunction, ArgSlot):
 
     """ Disjunction of two or more argument slots """
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' Reading and writing project files.
+
+A project (.ta, .tb) is a JSON list of block records, optionally preceded
+by the magic number and often written with one record per line. Files from
+the Journal may be padded with nulls or cut short; the reader goes through
+them a record at a time, skips the padding and closes whatever brackets a
+truncated file leaves open.
+
+A project archive (.tbz) holds the same data in less space:
+
+    header  magic, format version, flags, lengths of the asset index and
+            of the block table
+    index   the zlib-compressed JSON list of (offset, size, prefix) of
+            each asset
+    table   the zlib-compressed JSON list of block records, with each long
+            string (such as an embedded image) replaced by a reference to
+            an asset; it is uncompressed and parsed a record at a time
+    assets  the strings, each stored once: base64 data URIs (embedded
+            images) as their decoded bytes after the prefix, anything else
+            zlib-compressed (with no prefix); each is read from the file
+            (memory-mapped when possible) only when a record refers to it
+'''
+
+import base64
+import hashlib
+import logging
+import mmap
+import re
+import struct
+import zlib
+
+try:
+    import json
+    from json import JSONDecoder
+except ImportError:
+    try:
+        import simplejson as json
+        from simplejson import JSONDecoder
+    except ImportError:
+        JSONDecoder = None  # see tautils.OLD_SUGAR_SYSTEM
+
+from .taconstants import MAGICNUMBER
+
+_logger = logging.getLogger('turtleart-activity')
+
+_CHUNK_SIZE = 65536  # bytes read at a time
+_WHITESPACE = ' \t\r\n\0'
+_SEPARATORS = _WHITESPACE + ','  # between records
+
+_ARCHIVE_MAGIC = '\x89TBZ'  # not text, so never taken for JSON or pickle
+_ARCHIVE_VERSION = 1
+_ARCHIVE_HEADER = struct.Struct('>4sHHII')
+_ASSET_KEY = '\0asset'  # {_ASSET_KEY: n} stands for asset n
+_MIN_ASSET_SIZE = 1024  # shorter strings stay in the table
+_DATA_URI = re.compile(r'data:[^;,]+;base64,')
+
+
+def _tuplify(value):
+    ''' json converts tuples to lists, so we need to convert back '''
+    if not isinstance(value, list):
+        return value
+    return tuple(map(_tuplify, value))
+
+
+class _Stream(object):
+    ''' The text of a file, read as the parser needs it '''
+
+    def __init__(self, file_handle):
+        self._file = file_handle
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=_CHUNK_SIZE):
+        ''' Read more text; returns False at the end of the file '''
+        if self.eof:
+            return False
+        # Drop what has been parsed already
+        if self.pos > 0:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        data = self._file.read(size)
+        if not data:
+            self.eof = True
+            return False
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.text += data
+        return True
+
+    def skip(self, chars):
+        ''' Move past any of chars; returns the next character, or '' at
+        the end of the file '''
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def rest(self):
+        ''' All the text not parsed yet '''
+        while self.fill():
+            pass
+        return self.text[self.pos:]
+
+
+def _close_brackets(text):
+    ''' Close the strings, lists and dictionaries left open at the end of
+    truncated text '''
+    closing = []
+    in_string = False
+    escaped = False
+    for c in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == '[':
+            closing.append(']')
+        elif c == '{':
+            closing.append('}')
+        elif c in ']}' and closing:
+            closing.pop()
+    if in_string:
+        if escaped:
+            text = text[:-1]
+        text += '"'
+    else:
+        text = text.rstrip(_SEPARATORS)
+    closing.reverse()
+    return text + ''.join(closing)
+
+
+def _decode_truncated(decoder, text):
+    ''' The value at the start of text, closing any open brackets; raises
+    ValueError if there is no sense to be made of it '''
+    try:
+        return decoder.raw_decode(text)[0]
+    except ValueError:
+        return decoder.raw_decode(_close_brackets(text))[0]
+
+
+def _open(file_handle):
+    ''' A stream positioned after the magic number and any leading
+    whitespace, and the first character of the data '''
+    if JSONDecoder is None:
+        raise ValueError('no JSON decoder')
+    stream = _Stream(file_handle)
+    while len(stream.text) < len(MAGICNUMBER) and stream.fill():
+        pass
+    if stream.text.startswith(MAGICNUMBER):
+        stream.pos = len(MAGICNUMBER)
+    return stream, stream.skip(_WHITESPACE)
+
+
+def _records(stream):
+    ''' Yield the records of the list the stream is in, each as soon as
+    it has been read '''
+    decoder = JSONDecoder(strict=False)
+    size = _CHUNK_SIZE
+    while True:
+        c = stream.skip(_SEPARATORS)
+        if c in ('', ']'):
+            return
+        try:
+            value, end = decoder.raw_decode(stream.text, stream.pos)
+        except ValueError:
+            end = None
+        # A value that runs to the end of the text read so far (e.g., a
+        # number) may go on in the text still to read.
+        if end is not None and (end < len(stream.text) or stream.eof):
+            stream.pos = end
+            size = _CHUNK_SIZE
+            yield _tuplify(value)
+        elif not stream.eof:
+            # Read ever larger chunks so that a big record (such as one
+            # with an embedded image) is not parsed over and over again.
+            stream.fill(size)
+            size *= 2
+        else:
+            try:
+                yield _tuplify(_decode_truncated(
+                    decoder, stream.text[stream.pos:]))
+            except ValueError:
+                _logger.debug('Ignoring %d bytes at the end of the project' %
+                              (len(stream.text) - stream.pos))
+            return
+
+
+def iter_records(file_handle):
+    ''' Yield the records (block descriptions) of a project as they are
+    read, with JSON lists converted to tuples. Raises ValueError if the
+    file does not hold a JSON list. '''
+    stream, c = _open(file_handle)
+    if c != '[':
+        raise ValueError('not a list')
+    stream.pos += 1
+    return _records(stream)
+
+
+def load_data(file_handle):
+    ''' Read JSON data from a file: a list (such as a project) is read a
+    record at a time and returned as a tuple. Raises ValueError if the
+    data cannot be parsed. '''
+    stream, c = _open(file_handle)
+    if c == '[':
+        stream.pos += 1
+        return tuple(_records(stream))
+    decoder = JSONDecoder(strict=False)
+    text = stream.rest().rstrip(_WHITESPACE)
+    try:
+        return _tuplify(decoder.decode(text))
+    except ValueError:
+        return _tuplify(decoder.decode(_close_brackets(text)))
+
+
+def starts_like_json(file_handle):
+    ''' Does the file look like JSON (rather than pickle) data? The file is
+    left where it was. '''
+    pos = file_handle.tell()
+    head = file_handle.read(len(MAGICNUMBER) + 1)
+    file_handle.seek(pos)
+    if head.startswith(MAGICNUMBER):
+        return True
+    head = head.lstrip(_WHITESPACE)
+    return head == '' or head[0] in '[{"'
+
+
+def is_archive(file_handle):
+    ''' Is the file a project archive? The file is left where it was. '''
+    pos = file_handle.tell()
+    head = file_handle.read(len(_ARCHIVE_MAGIC))
+    file_handle.seek(pos)
+    return head == _ARCHIVE_MAGIC
+
+
+def _split_data_uri(value):
+    ''' The prefix and decoded bytes of a base64 data URI, or None if
+    value is not one or would not be written back exactly the same '''
+    match = _DATA_URI.match(value)
+    if match is None:
+        return None
+    prefix = value[:match.end()]
+    try:
+        raw = base64.b64decode(value[match.end():])
+    except TypeError:
+        return None
+    if prefix + base64.b64encode(raw) != value:
+        return None
+    return prefix, raw
+
+
+def write_archive(data, file_handle):
+    ''' Write data (a list, such as a project) as an archive '''
+    assets = []  # (prefix, bytes); prefix is None for compressed text
+    numbers = {}  # digest: asset number
+
+    def pack(value):
+        if isinstance(value, (list, tuple)):
+            return [pack(v) for v in value]
+        if isinstance(value, dict):
+            return dict([(k, pack(v)) for k, v in value.iteritems()])
+        if isinstance(value, basestring) and len(value) >= _MIN_ASSET_SIZE:
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            digest = hashlib.sha1(value).digest()
+            if digest not in numbers:
+                numbers[digest] = len(assets)
+                data_uri = _split_data_uri(value)
+                if data_uri is None:
+                    assets.append((None, zlib.compress(value)))
+                else:
+                    assets.append(data_uri)
+            return {_ASSET_KEY: numbers[digest]}
+        return value
+
+    table = zlib.compress(json.dumps(pack(data), separators=(',', ':')))
+    index = []
+    offset = 0
+    for prefix, asset in assets:
+        index.append((offset, len(asset), prefix))
+        offset += len(asset)
+    index = zlib.compress(json.dumps(index, separators=(',', ':')))
+    file_handle.write(_ARCHIVE_HEADER.pack(_ARCHIVE_MAGIC, _ARCHIVE_VERSION,
+                                           0, len(index), len(table)))
+    file_handle.write(index)
+    file_handle.write(table)
+    for prefix, asset in assets:
+        file_handle.write(asset)
+
+
+class _Inflater(object):
+    ''' A file-like object for reading zlib-compressed data, uncompressed
+    a chunk at a time '''
+
+    def __init__(self, read, start, size):
+        self._read = read
+        self._pos = start
+        self._end = start + size
+        self._decompressor = zlib.decompressobj()
+
+    def read(self, size):
+        data = ''
+        while not data and self._pos < self._end:
+            chunk = self._read(self._pos, min(size, self._end - self._pos))
+            self._pos += len(chunk)
+            if not chunk:
+                self._end = self._pos  # the file is shorter than it says
+            try:
+                data = self._decompressor.decompress(chunk)
+            except zlib.error as e:
+                raise ValueError('bad block table: %s' % e)
+        if not data:
+            data = self._decompressor.flush()
+        return data
+
+
+class ProjectArchive(object):
+    ''' A project archive, read from a file (memory-mapped when possible).
+    Only the header and the asset index are read at first; the records
+    are parsed as they are asked for, and each asset is read and decoded
+    the first time a record refers to it. '''
+
+    def __init__(self, file_handle):
+        self._file = file_handle
+        try:
+            self._buffer = mmap.mmap(file_handle.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError,
+                mmap.error):  # e.g., StringIO or an empty file
+            self._buffer = None
+        header = self._read(0, _ARCHIVE_HEADER.size)
+        if len(header) < _ARCHIVE_HEADER.size:
+            raise ValueError('truncated archive')
+        magic, version, flags, index_size, table_size = \
+            _ARCHIVE_HEADER.unpack(header)
+        if magic != _ARCHIVE_MAGIC:
+            raise ValueError('not a project archive')
+        if version > _ARCHIVE_VERSION:
+            raise ValueError('archive version %d is not supported' % version)
+        self._table_start = _ARCHIVE_HEADER.size + index_size
+        self._table_size = table_size
+        self._assets_start = self._table_start + table_size
+        try:
+            self._asset_index = json.loads(zlib.decompress(
+                self._read(_ARCHIVE_HEADER.size, index_size)))
+        except (zlib.error, ValueError) as e:
+            raise ValueError('bad asset index: %s' % e)
+        self._assets = {}
+
+    def _read(self, start, size):
+        if self._buffer is not None:
+            return self._buffer[start:start + size]
+        self._file.seek(start)
+        return self._file.read(size)
+
+    def asset(self, n):
+        ''' The string stored as asset n '''
+        if n not in self._assets:
+            try:
+                offset, size, prefix = self._asset_index[n]
+            except (IndexError, TypeError, ValueError):
+                raise ValueError('no asset %r' % (n,))
+            value = self._read(self._assets_start + offset, size)
+            if len(value) < size:
+                raise ValueError('truncated asset %d' % n)
+            if prefix is None:
+                try:
+                    value = zlib.decompress(value)
+                except zlib.error as e:
+                    raise ValueError(str(e))
+                self._assets[n] = value.decode('utf-8')
+            else:
+                self._assets[n] = prefix + base64.b64encode(value)
+        return self._assets[n]
+
+    def records(self):
+        ''' Yield the records of the data, as iter_records would from a
+        JSON file '''
+        return (self._unpack(record)
+                for record in iter_records(_Inflater(
+                    self._read, self._table_start, self._table_size)))
+
+    def get_data(self):
+        ''' The data, as load_data would return it from a JSON file '''
+        return self._unpack(load_data(_Inflater(
+            self._read, self._table_start, self._table_size)))
+
+    def _unpack(self, value):
+        # The lists and tuples are as load_data left them
+        if isinstance(value, (list, tuple)):
+            return type(value)([self._unpack(v) for v in value])
+        if isinstance(value, dict):
+            if len(value) == 1 and _ASSET_KEY in value:
+                return self.asset(value[_ASSET_KEY])
+            return dict([(k, self._unpack(v))
+                         for k, v in value.iteritems()])
+        return value
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        self._assets = {}
+
+
+def read_archive(file_handle):
+    ''' Read the data from a project archive; raises ValueError if the
+    archive cannot be read '''
+    archive = ProjectArchive(file_handle)
+    try:
+        return archive.get_data()
+    finally:
+        archive.close()
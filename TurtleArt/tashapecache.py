@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' A cache of rendered block shapes shared by all blocks, with a copy on
+disk so that the shapes are not rendered again at the next start. New
+shapes are written to disk a few at a time while the main loop is idle. '''
+
+import base64
+import cairo
+import gobject
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from StringIO import StringIO
+
+from . import tasprite_factory
+from .tautils import debug_output
+
+# Bump when the format of the files on disk changes
+_CACHE_VERSION = 1
+_MAX_SHAPES = 1024  # shapes kept in memory
+_MAX_FILES = 4096  # shapes kept on disk
+_MAX_PENDING = 256  # new shapes waiting to be written to disk
+_SAVE_BATCH = 8  # shapes written to disk per idle callback
+
+
+def _factory_stamp():
+    ''' Shapes saved by another version of the sprite factory are stale '''
+    try:
+        info = os.stat(tasprite_factory.__file__)
+        return '%d-%d-%d' % (_CACHE_VERSION, info.st_size, info.st_mtime)
+    except OSError:
+        return str(_CACHE_VERSION)
+
+
+def _from_json(value):
+    ''' json.load returns unicode; the sprite factory expects str '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_from_json(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(_from_json(k), _from_json(v))
+                     for k, v in value.iteritems()])
+    return value
+
+
+def _copy_state(state):
+    ''' A copy of the SVG state that shares no lists with the original '''
+    copy = {}
+    for attr, value in state.iteritems():
+        if isinstance(value, list):
+            value = [v[:] if isinstance(v, list) else v for v in value]
+        copy[attr] = value
+    return copy
+
+
+def _surface_to_png(surface):
+    data = StringIO()
+    surface.write_to_png(data)
+    return base64.b64encode(data.getvalue())
+
+
+def _png_to_surface(data):
+    return cairo.ImageSurface.create_from_png(
+        StringIO(base64.b64decode(data)))
+
+
+class ShapeCache(object):
+    ''' Rendered shapes (cairo surfaces) and the SVG state left by the
+    rendering (size, docks, margins), keyed on the SVG state before it '''
+
+    def __init__(self, max_shapes=_MAX_SHAPES):
+        self._shapes = OrderedDict()
+        self._max_shapes = max_shapes
+        self._path = None
+        self._prefix = None  # of the names of the files with current shapes
+        self._pending = OrderedDict()  # shapes to write to disk
+        self._save_id = None
+        self._file_count = None  # files on disk, once counted
+
+    def set_path(self, path):
+        ''' Directory for the copy on disk (None to keep shapes in memory
+        only) '''
+        self._path = path
+        if path is not None:
+            if self._prefix is None:
+                self._prefix = hashlib.sha1(
+                    _factory_stamp()).hexdigest()[:8] + '-'
+            self._file_count = None
+            gobject.idle_add(self._clean_cb)
+
+    def clear(self):
+        self._shapes.clear()
+
+    def _file_name(self, key):
+        digest = hashlib.sha1(repr(key)).hexdigest()
+        return os.path.join(self._path, self._prefix + digest + '.json')
+
+    def _list_files(self):
+        ''' Returns (modification time, file name) for each current shape
+        on disk. Shapes saved by other versions of the sprite factory are
+        removed. '''
+        files = []
+        try:
+            names = os.listdir(self._path)
+        except OSError:
+            return files
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            file_name = os.path.join(self._path, name)
+            try:
+                if name.startswith(self._prefix):
+                    files.append((os.path.getmtime(file_name), file_name))
+                else:
+                    os.remove(file_name)
+            except OSError:
+                pass
+        return files
+
+    def _clean_cb(self):
+        if self._path is not None:
+            self._file_count = len(self._list_files())
+            self._prune()
+        return False
+
+    def _prune(self):
+        ''' Keep no more than _MAX_FILES shapes on disk, removing the least
+        recently used ones (and some more, so that this is not done again at
+        the next save) '''
+        if self._file_count is None or self._file_count <= _MAX_FILES:
+            return
+        files = sorted(self._list_files())
+        keep = _MAX_FILES * 3 / 4
+        for mtime, file_name in files[:-keep]:
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+        self._file_count = min(len(files), keep)
+
+    def get(self, key):
+        ''' Returns (state, surfaces) or None '''
+        if key in self._shapes:
+            shape = self._shapes.pop(key)
+            self._shapes[key] = shape  # most recently used
+        elif self._path is not None:
+            shape = self._load(key)
+            if shape is None:
+                return None
+            self._remember(key, shape)
+        else:
+            return None
+        state, surfaces = shape
+        return _copy_state(state), surfaces
+
+    def add(self, key, state, surfaces):
+        shape = (_copy_state(state), surfaces)
+        self._remember(key, shape)
+        if self._path is not None:
+            self._pending[key] = shape
+            while len(self._pending) > _MAX_PENDING:
+                self._pending.popitem(last=False)
+            if self._save_id is None:
+                self._save_id = gobject.idle_add(self._save_cb)
+
+    def _save_cb(self):
+        ''' Write a few of the new shapes to disk '''
+        for i in range(_SAVE_BATCH):
+            if not self._pending or self._path is None:
+                break
+            key, shape = self._pending.popitem(last=False)
+            if self._save(key, shape) and self._file_count is not None:
+                self._file_count += 1
+        self._prune()
+        if self._pending and self._path is not None:
+            return True
+        self._save_id = None
+        return False
+
+    def _remember(self, key, shape):
+        self._shapes[key] = shape
+        while len(self._shapes) > self._max_shapes:
+            self._shapes.popitem(last=False)
+
+    def _load(self, key):
+        file_name = self._file_name(key)
+        if not os.path.exists(file_name):
+            return None
+        try:
+            fd = open(file_name, 'r')
+            data = json.load(fd)
+            fd.close()
+            # The least recently used shapes are the first to go
+            os.utime(file_name, None)
+            surfaces = [_png_to_surface(image) for image in data['images']]
+            return _from_json(data['state']), surfaces
+        except (IOError, OSError, ValueError, KeyError, TypeError,
+                cairo.Error) as e:
+            debug_output('Could not read shape %s: %s' % (file_name, e))
+            return None
+
+    def _save(self, key, shape):
+        state, surfaces = shape
+        file_name = self._file_name(key)
+        try:
+            if not os.path.exists(self._path):
+                os.makedirs(self._path)
+            data = {'state': state,
+                    'images': [_surface_to_png(s) for s in surfaces]}
+            # Write to a temporary file first so that another instance
+            # never reads a partial file
+            tmp_file_name = '%s.%d' % (file_name, os.getpid())
+            fd = open(tmp_file_name, 'w')
+            json.dump(data, fd)
+            fd.close()
+            os.rename(tmp_file_name, file_name)
+            return True
+        except (IOError, OSError) as e:
+            debug_output('Could not save shape %s: %s' % (file_name, e))
+            return False
+
+
+# Shared by all blocks
+shape_cache = ShapeCache()
@@ -23,11 +23,71 @@
 import pygtk
 pygtk.require('2.0')
 import gtk
+import cairo
 import os
+from math import atan2, pi, radians, sqrt
 
 from .taconstants import HIT_RED, HIT_GREEN, HIDE_WHITE, SHOW_WHITE, \
     PALETTE_COLOR, TOOLBAR_COLOR
 
+# Attributes that the block drawing methods set before reading them, so
+# they don't change the outcome of drawing a block.
+_DRAWING_RESULTS = ('_x', '_y', '_min_x', '_min_y', '_max_x', '_max_y',
+                    '_width', '_height', 'docks', 'margins', '_gradient')
+
+
+def _color_to_rgb(color):
+    """ (red, green, blue) for '#RRGGBB' or '#RGB'; None for 'none' """
+    if color == 'none':
+        return None
+    if not color.startswith('#') or len(color) not in (4, 7):
+        raise ValueError('unknown color %s' % (color))
+    if len(color) == 4:
+        color = '#' + color[1] * 2 + color[2] * 2 + color[3] * 2
+    return (int(color[1:3], 16) / 255.0, int(color[3:5], 16) / 255.0,
+            int(color[5:7], 16) / 255.0)
+
+
+def _fill_and_stroke(cr, fill, stroke, stroke_width):
+    """ Fill (with a color or a cairo pattern) and stroke the path """
+    if isinstance(fill, cairo.Pattern):
+        cr.set_source(fill)
+        cr.fill_preserve()
+    else:
+        rgb = _color_to_rgb(fill)
+        if rgb is not None:
+            cr.set_source_rgb(*rgb)
+            cr.fill_preserve()
+    rgb = _color_to_rgb(stroke)
+    if rgb is not None:
+        cr.set_source_rgb(*rgb)
+        cr.set_line_width(stroke_width)
+        cr.stroke_preserve()
+    cr.new_path()
+
+
+def _arc_to(cr, x0, y0, r, large, sweep, x, y):
+    """ The circular SVG arc ('A r r 0 large sweep x y') from (x0, y0),
+    converted to cairo's center parameterization """
+    dx = (x0 - x) / 2.0
+    dy = (y0 - y) / 2.0
+    d2 = dx * dx + dy * dy
+    if d2 == 0:
+        return
+    if r * r < d2:  # SVG scales up radii that are too small
+        r = sqrt(d2)
+    k = sqrt(max(0, (r * r - d2) / d2))
+    if large == sweep:
+        k = -k
+    cx = k * dy + (x0 + x) / 2.0
+    cy = -k * dx + (y0 + y) / 2.0
+    a0 = atan2(y0 - cy, x0 - cx)
+    a1 = atan2(y - cy, x - cx)
+    if sweep:
+        cr.arc(cx, cy, r, a0, a1)
+    else:
+        cr.arc_negative(cx, cy, r, a0, a1)
+
 
 class SVG:
 
@@ -99,6 +159,7 @@ class SVG:
         self._gradient_color = "#FFFFFF"
         self._gradient = False
         self.margins = [0, 0, 0, 0]
+        self._ops = None  # drawing operations recorded by to_surface
 
     """
     The block construction methods typically start on the upper-left side
@@ -178,6 +239,8 @@ class SVG:
         self.calc_w_h()
         self._close_path()
         self.style()
+        if self._ops is not None:
+            del self._ops[:]
         return self.header() + self.footer()
 
     def basic_flow(self):
@@ -732,6 +795,24 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
     def clear_docks(self):
         self.docks = []
 
+    def get_parameters(self):
+        """ A hashable summary of the settings that determine the block
+        drawn (and its docks and margins) """
+        parameters = []
+        for attr, value in sorted(self.__dict__.iteritems()):
+            if attr in _DRAWING_RESULTS:
+                continue
+            if isinstance(value, list):
+                value = tuple(value)
+            parameters.append((attr, value))
+        return tuple(parameters)
+
+    def get_state(self):
+        return self.__dict__.copy()
+
+    def set_state(self, state):
+        self.__dict__.update(state)
+
     def set_scale(self, scale=1):
         self._scale = scale
 
@@ -833,6 +914,8 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
     # SVG helper methods
     #
     def header(self, center=False):
+        if self._ops is not None:
+            return ''
         return '<svg\n\
     xmlns:svg="http://www.w3.org/2000/svg"\n\
     xmlns="http://www.w3.org/2000/svg"\n\
@@ -884,12 +967,18 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
                 (self._scale, self._scale, orientation)
 
     def footer(self):
+        if self._ops is not None:
+            return ''
         if self._orientation != 0:
             return "   </g>\n</g>\n</svg>\n"
         else:
             return "   </g>\n</svg>\n"
 
     def style(self):
+        if self._ops is not None:
+            self._ops.append(('paint', self._fill, self._stroke,
+                              self._stroke_width, self._gradient))
+            return ''
         if self._gradient is True:
             fill = "url(#linearGradient5678)"
         else:
@@ -934,11 +1023,17 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
                    "\"/>\n")
 
     def _circle(self, r, cx, cy):
+        if self._ops is not None:
+            self._ops.append(('circle', r, cx, cy, self._fill, self._stroke))
+            return ''
         return "%s%s%s%s%s%f%s%f%s%f%s" % \
             ("<circle style=\"fill:", self._fill, ";stroke:", self._stroke,
              ";\" r=\"", r, "\" cx=\"", cx, "\" cy=\"", cy, "\" />\n")
 
     def _rect(self, w, h, x, y):
+        if self._ops is not None:
+            self._ops.append(('rect', w, h, x, y, self._fill, self._stroke))
+            return ''
         return "%s%s%s%s%s%f%s%f%s%f%s%f%s" % ("<rect style=\"fill:",
                                                self._fill,
                                                ";stroke:",
@@ -986,6 +1081,9 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
             self._x = x
             self._y = y
             self._check_min_max()
+            if self._ops is not None:
+                self._ops.append(('line', x, y))
+                return ''
             return "L %.1f %.1f " % (x, y)
 
     def _rline_to(self, dx, dy):
@@ -999,9 +1097,13 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
         if r == 0:
             return self.line_to(x, y)
         else:
+            if self._ops is not None:
+                self._ops.append(('arc', self._x, self._y, r, l, s, x, y))
             self._x = x
             self._y = y
             self._check_min_max()
+            if self._ops is not None:
+                return ''
             return "A %.1f %.1f %.1f %d %d %.1f %.1f " % (
                 r, r, a, l, s, x, y)
 
@@ -1075,15 +1177,28 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
         """
         self._x = x
         self._y = y
+        if self._ops is not None:
+            self._ops.append(('move', x, y))
+            return ''
         return "      <path d=\"m%.1f %.1f " % (x, y)
 
     def _close_path(self):
+        if self._ops is not None:
+            self._ops.append(('close',))
+            return ''
         return "z\"\n"
 
+    def _ungroup(self):
+        ''' The dots are drawn in pixels, outside of the scaled group '''
+        if self._ops is not None:
+            self._ops.append(('identity',))
+            return ''
+        return "</g>/n<g>/n"
+
     def _hide_dot(self, noscale=False):
         _saved_fill, _saved_stroke = self._fill, self._stroke
         self._fill, self._stroke = HIT_RED, HIT_RED
-        svg = "</g>/n<g>/n"
+        svg = self._ungroup()
         if noscale:
             scale = 2.0
             x = self._hide_x * scale
@@ -1112,7 +1227,7 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
     def _show_dot(self):
         _saved_fill, _saved_stroke = self._fill, self._stroke
         self._fill, self._stroke = HIT_GREEN, HIT_GREEN
-        svg = "</g>/n<g>/n"
+        svg = self._ungroup()
         scale = self._scale * 1.75
         scale2 = scale / 2
         svg += self._circle(self._dot_radius * scale2,
@@ -1306,6 +1421,97 @@ stroke-width="3.5" fill="%s" stroke="none" />\n' % (self._stroke)
         self.margins[1] *= self._scale
         return(x, y)
 
+    #
+    # Cairo drawing
+    #
+
+    def to_surface(self, function, *args):
+        """ Draw a shape (one of the methods above, such as basic_block)
+        straight onto a cairo surface rather than through SVG text. Shapes
+        written as raw SVG (e.g., the turtle) go through librsvg. """
+        docks = self.docks[:]
+        self._ops = []
+        try:
+            svg_string = function(*args)
+            ops = self._ops
+        finally:
+            self._ops = None
+        if not svg_string:
+            try:
+                return self._draw(ops)
+            except ValueError:  # a color cairo doesn't know, e.g. 'red'
+                pass
+        self.docks = docks
+        pixbuf = svg_str_to_pixbuf(function(*args))
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(self._width),
+                                     int(self._height))
+        context = gtk.gdk.CairoContext(cairo.Context(surface))
+        context.set_source_pixbuf(pixbuf, 0, 0)
+        context.rectangle(0, 0, int(self._width), int(self._height))
+        context.fill()
+        return surface
+
+    def calculate(self, function, *args):
+        """ Work out the size, docks and margins of a shape without
+        drawing it """
+        self._ops = []
+        try:
+            function(*args)
+        finally:
+            self._ops = None
+
+    def _draw(self, ops):
+        """ Play back the operations recorded while drawing a shape """
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(self._width),
+                                     int(self._height))
+        cr = cairo.Context(surface)
+        # As in header()
+        cr.scale(self._scale, self._scale)
+        if self._orientation != 0:
+            cr.translate(self._width / 2.0, self._height / 2.0)
+            cr.rotate(radians(self._orientation))
+            cr.translate(-self._width / 2.0, -self._height / 2.0)
+        cr.set_miter_limit(4)  # the SVG default
+        for op in ops:
+            if op[0] == 'move':
+                cr.new_path()
+                cr.move_to(op[1], op[2])
+            elif op[0] == 'line':
+                cr.line_to(op[1], op[2])
+            elif op[0] == 'arc':
+                _arc_to(cr, *op[1:])
+            elif op[0] == 'close':
+                cr.close_path()
+            elif op[0] == 'paint':
+                fill, stroke, stroke_width, gradient = op[1:]
+                if gradient:
+                    # As in _defs()
+                    pattern = cairo.LinearGradient(
+                        0, self._height / 2.0, self._width / self._scale,
+                        self._height / 2.0)
+                    pattern.add_color_stop_rgb(
+                        0, *_color_to_rgb(self._gradient_color))
+                    pattern.add_color_stop_rgb(1, *_color_to_rgb(fill))
+                    fill = pattern
+                cr.set_line_cap(cairo.LINE_CAP_ROUND)
+                _fill_and_stroke(cr, fill, stroke, stroke_width)
+            elif op[0] == 'identity':
+                cr.identity_matrix()
+            elif op[0] == 'circle':
+                r, cx, cy, fill, stroke = op[1:]
+                cr.new_path()
+                cr.arc(cx, cy, r, 0, 2 * pi)
+                cr.set_line_cap(cairo.LINE_CAP_BUTT)
+                _fill_and_stroke(cr, fill, stroke, 1)
+            elif op[0] == 'rect':
+                w, h, x, y, fill, stroke = op[1:]
+                cr.new_path()
+                cr.rectangle(x, y, w, h)
+                cr.set_line_cap(cairo.LINE_CAP_BUTT)
+                _fill_and_stroke(cr, fill, stroke, 1)
+        surface.flush()
+        return surface
+
 #
 # Command-line tools for testing
 #
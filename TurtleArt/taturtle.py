@@ -19,12 +19,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os
-
 import gtk
 import gobject
 import cairo
-import tempfile
 
 from random import uniform
 from math import sin, cos, pi, sqrt
@@ -33,8 +30,8 @@ from .taconstants import (TURTLE_LAYER, DEFAULT_TURTLE_COLORS, DEFAULT_TURTLE,
 from .tasprite_factory import SVG, svg_str_to_pixbuf
 from .tacanvas import wrap100, COLOR_TABLE
 from .sprites import Sprite
-from .tautils import (debug_output, data_to_string, round_int, get_path,
-                      image_to_base64)
+from .tautils import (debug_output, data_to_string, round_int,
+                      pixbuf_to_base64)
 from TurtleArt.talogo import logoerror
 
 SHAPES = 36
@@ -665,16 +662,7 @@ class Turtle:
             pixbuf, a, b, x, y, w, h, self._heading)
 
         if self._turtles.turtle_window.sharing() and share:
-            if self._turtles.turtle_window.running_sugar:
-                tmp_path = get_path(self._turtles.turtle_window.activity,
-                                    'instance')
-            else:
-                tmp_path = tempfile.gettempdir()
-            tmp_file = os.path.join(
-                get_path(self._turtles.turtle_window.activity, 'instance'),
-                'tmpfile.png')
-            pixbuf.save(tmp_file, 'png', {'quality': '100'})
-            data = image_to_base64(tmp_file, tmp_path)
+            data = pixbuf_to_base64(pixbuf)
             height = pixbuf.get_height()
             width = pixbuf.get_width()
 
@@ -690,8 +678,6 @@ class Turtle:
                                                data]]))
             gobject.idle_add(self._turtles.turtle_window.send_event, event)
 
-            os.remove(tmp_file)
-
     def draw_text(self, label, x, y, size, w, share=True):
         ''' Draw text '''
         self._turtles.turtle_window.canvas.draw_text(
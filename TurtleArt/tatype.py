@@ -91,10 +91,50 @@ BOX_AST = ast.Name(id='BOX', ctx=ast.Load)
 ACTION_AST = ast.Name(id='ACTION', ctx=ast.Load)
 
 
+# Types of plain Python values, looked up by type(x) before trying the
+# isinstance tests in get_type
+_PYTHON_TYPES = {int: TYPE_INT, long: TYPE_INT, bool: TYPE_INT,
+                 float: TYPE_FLOAT}
+
+# Types of recently seen short strings (deciding whether a string is
+# numeric means trying to parse it)
+_STRING_TYPES = {}
+_STRING_TYPES_SIZE = 1024
+_STRING_TYPES_MAX_LENGTH = 64
+
+
+def _get_string_type(x):
+    """ The type of a string, TYPE_CHAR, TYPE_NUMERIC_STRING or
+    TYPE_STRING """
+    type_ = _STRING_TYPES.get(x)
+    if type_ is not None:
+        return type_
+    if len(x) == 1:
+        type_ = TYPE_CHAR
+    else:
+        try:
+            float(x)
+        except ValueError:
+            type_ = TYPE_STRING
+        else:
+            type_ = TYPE_NUMERIC_STRING
+    if len(x) <= _STRING_TYPES_MAX_LENGTH:
+        if len(_STRING_TYPES) >= _STRING_TYPES_SIZE:
+            _STRING_TYPES.clear()
+        _STRING_TYPES[x] = type_
+    return type_
+
+
 def get_type(x):
     """ Return the most specific type in the type hierarchy that applies to x
     and a boolean indicating whether x is an AST. If the type cannot be
     determined, return TYPE_OBJECT as the type. """
+    type_ = _PYTHON_TYPES.get(type(x))
+    if type_ is not None:
+        return (type_, False)
+    if type(x) in (str, unicode):
+        return (_get_string_type(x), False)
+
     # non-AST types
     if isinstance(x, (int, long)):
         return (TYPE_INT, False)
@@ -263,6 +303,44 @@ class TATypeError(BaseException):
     __repr__ = __str__
 
 
+# Every converter or converter chain that get_converter can return, as
+# _CONVERTER_CHAINS[old_type][new_type]; computed by update_converters
+_CONVERTER_CHAINS = {}
+
+# Incremented whenever the converters change, so that anything caching
+# converters (e.g., Primitive) knows to forget them
+converter_generation = 0
+
+
+def update_converters():
+    """ Recompute the table of converter chains from TYPE_CONVERTERS. Call
+    this after changing TYPE_CONVERTERS directly. """
+    global converter_generation
+    _CONVERTER_CHAINS.clear()
+    targets = []
+    for converters_from_old in TYPE_CONVERTERS.values():
+        for new_type in converters_from_old:
+            if new_type not in targets:
+                targets.append(new_type)
+    for old_type in TYPE_CONVERTERS:
+        chains = {}
+        for new_type in targets:
+            if new_type == TYPE_OBJECT or old_type == new_type:
+                continue
+            converter = _search_converter(old_type, new_type)
+            if converter is not None:
+                chains[new_type] = converter
+        _CONVERTER_CHAINS[old_type] = chains
+    converter_generation += 1
+
+
+def register_converter(old_type, new_type, converter):
+    """ Add a converter old_type -> new_type to the type hierarchy (e.g.,
+    from a plugin), making old_type a subtype of new_type. """
+    TYPE_CONVERTERS.setdefault(old_type, {})[new_type] = converter
+    update_converters()
+
+
 def get_converter(old_type, new_type):
     """ If there is a converter old_type -> new_type, return it. Else return
     None. If a chain of converters is necessary, return it as a tuple or
@@ -273,7 +351,15 @@ def get_converter(old_type, new_type):
     # every type can be converted to itself
     if old_type == new_type:
         return identity
+    chains = _CONVERTER_CHAINS.get(old_type)
+    if chains is None:
+        return None
+    return chains.get(new_type)
 
+
+def _search_converter(old_type, new_type):
+    """ Find the converter or the shortest converter chain old_type ->
+    new_type in TYPE_CONVERTERS, or return None """
     # is there a converter for this pair of types?
     converters_from_old = TYPE_CONVERTERS.get(old_type)
     if converters_from_old is None:
@@ -314,6 +400,9 @@ def get_converter(old_type, new_type):
     return None
 
 
+update_converters()
+
+
 def convert(x, new_type, old_type=None, converter=None):
     """ Convert x to the new type if possible.
     old_type -- the type of x. If not given, it is computed. """
@@ -34,6 +34,8 @@ try:
 except ImportError:
     HAS_DBUS = False
 import cairo
+import base64
+import hashlib
 import pickle
 import subprocess
 import os
@@ -46,19 +48,21 @@ try:
     OLD_SUGAR_SYSTEM = False
     import json
     json.dumps
-    from json import load as jload
     from json import dump as jdump
 except (ImportError, AttributeError):
     try:
         import simplejson as json
-        from simplejson import load as jload
         from simplejson import dump as jdump
     except:
         OLD_SUGAR_SYSTEM = True
 from StringIO import StringIO
+from collections import OrderedDict
 
 from .taconstants import (HIT_HIDE, HIT_SHOW, XO1, XO15, XO175, XO4, UNKNOWN,
-                          MAGICNUMBER, SUFFIX, ARG_MUST_BE_NUMBER)
+                          SUFFIX, ARCHIVE_SUFFIX, ARG_MUST_BE_NUMBER)
+from .taproject import (load_data, iter_records, starts_like_json,
+                        is_archive, ProjectArchive, read_archive,
+                        write_archive)
 
 import logging
 _logger = logging.getLogger('turtleart-activity')
@@ -151,33 +155,20 @@ def magnitude(pos):
 def json_load(text):
     ''' Load JSON data using what ever resources are available. '''
     if OLD_SUGAR_SYSTEM is True:
-        listdata = json.read(text)
-    else:
-        # Remove MAGIC NUMBER, if present, and leading whitespace
-        if text[0:2] == MAGICNUMBER:
-            clean_text = text[2:].lstrip()
-        else:
-            clean_text = text.lstrip()
-        # Strip out trailing whitespace, nulls, and newlines
-        clean_text = clean_text.replace('\12', '')
-        clean_text = clean_text.replace('\00', '')
-        clean_text = clean_text.rstrip()
-        # Look for missing ']'s
-        left_count = clean_text.count('[')
-        right_count = clean_text.count(']')
-        while left_count > right_count:
-            clean_text += ']'
-            right_count = clean_text.count(']')
-        io = StringIO(clean_text)
-        try:
-            listdata = jload(io)
-        except ValueError:
-            # Assume that text is ascii list
-            listdata = text.split()
-            for i, value in enumerate(listdata):
-                listdata[i] = convert(value, float)
-    # json converts tuples to lists, so we need to convert back,
-    return _tuplify(listdata)
+        # json converts tuples to lists, so we need to convert back,
+        return _tuplify(json.read(text))
+    try:
+        return load_data(StringIO(text))
+    except ValueError:
+        return _ascii_load(text)
+
+
+def _ascii_load(text):
+    ''' Assume that text is ascii list '''
+    listdata = text.split()
+    for i, value in enumerate(listdata):
+        listdata[i] = convert(value, float)
+    return tuple(listdata)
 
 
 def find_hat(data):
@@ -329,7 +320,10 @@ def get_save_name(filefilter, load_save_folder, save_file_name):
     else:
         suffix = SUFFIX[1]
     if save_file_name is not None:
-        if not save_file_name.endswith(suffix):
+        if isinstance(filefilter, tuple):
+            if not save_file_name.endswith(filefilter):
+                save_file_name = save_file_name + suffix
+        elif not save_file_name.endswith(suffix):
             save_file_name = save_file_name + suffix
         dialog.set_current_name(save_file_name)
     return do_dialog(dialog, filefilter, load_save_folder)
@@ -363,56 +357,102 @@ def chooser_dialog(parent_window, filter, action):
 
 def data_from_file(ta_file):
     ''' Open the .ta file, ignoring any .png file that might be present. '''
-    file_handle = open(ta_file, 'r')
+    file_handle = open(ta_file, 'rb')
     #
     # We try to maintain read-compatibility with all versions of Turtle Art.
-    # Try pickle first; then different versions of json.
+    # Try pickle first (unless the file looks like json or is an archive);
+    # then json, read a block at a time rather than all at once.
     #
     try:
-        data = pickle.load(file_handle)
-    except:
-        # Rewind necessary because of failed pickle.load attempt
-        file_handle.seek(0)
-        text = file_handle.read()
-        data = data_from_string(text)
-    file_handle.close()
-    return data
+        if is_archive(file_handle):
+            return read_archive(file_handle)
+        if not starts_like_json(file_handle):
+            try:
+                return pickle.load(file_handle)
+            except:
+                # Rewind necessary because of failed pickle.load attempt
+                file_handle.seek(0)
+        if OLD_SUGAR_SYSTEM is True:
+            return data_from_string(file_handle.read())
+        try:
+            return load_data(file_handle)
+        except ValueError:
+            file_handle.seek(0)
+            return _ascii_load(file_handle.read())
+    finally:
+        file_handle.close()
+
+
+def iter_data_from_file(ta_file):
+    ''' Yield the block records of a project file as they are read, so
+    that process_data can start on them before the whole file is parsed.
+    Files that are neither an archive nor a JSON list are read as
+    data_from_file does. '''
+    file_handle = open(ta_file, 'rb')
+    try:
+        if is_archive(file_handle):
+            archive = ProjectArchive(file_handle)
+            try:
+                for record in archive.records():
+                    yield record
+            finally:
+                archive.close()
+            return
+        if OLD_SUGAR_SYSTEM is not True and \
+                starts_like_json(file_handle):
+            try:
+                records = iter_records(file_handle)
+            except ValueError:
+                pass
+            else:
+                for record in records:
+                    yield record
+                return
+    finally:
+        file_handle.close()
+    for record in data_from_file(ta_file):
+        yield record
 
 
 def data_from_string(text):
     ''' JSON load data from a string. '''
     if isinstance(text, str):
-        return json_load(text.replace(']],\n', ']], '))
+        return json_load(text)
     elif isinstance(text, unicode):
-        text = text.encode('utf-8')
-        return json_load(text.replace(']],\n', ']], '))
+        return json_load(text.encode('utf-8'))
     else:
         print 'type error (%s) in data_from_string' % (type(text))
         return None
 
 
 def data_to_file(data, ta_file):
-    ''' Write data to a file. '''
+    ''' Write data to a file (as an archive if its name ends with
+    ARCHIVE_SUFFIX). '''
+    archive = ta_file.endswith(ARCHIVE_SUFFIX)
+    mode = 'wb' if archive else 'w'
     try:
-        file_handle = file(ta_file, 'w')
+        file_handle = file(ta_file, mode)
     except IOError as e:
         error_output('Could not write to %s: %s.' % (ta_file, e))
         tmp_file = os.path.join(os.path.expanduser('~'),
                                 os.path.basename(ta_file))
         try:
             debug_output('Trying to write to %s' % (tmp_file))
-            file_handle = file(tmp_file, 'w')
+            file_handle = file(tmp_file, mode)
         except IOError as e:
             error_output('Could not write to %s: %s.' % (tmp_file, e))
             tmp_file = os.path.join(tempfile.gettempdir(),
                                                      os.path.basename(ta_file))
             try:
                 debug_output('Trying to write to %s' % (tmp_file))
-                file_handle = file(tmp_file, 'w')
+                file_handle = file(tmp_file, mode)
             except IOError as e:
                 error_output('Could not write to %s: %s.' % (tmp_file, e))
                 return
-    file_handle.write(data_to_string(data))
+    if archive:
+        write_archive(data, file_handle)
+    else:
+        file_handle.write(data_to_string(data))
     file_handle.close()
 
 
@@ -422,10 +462,15 @@ def data_to_string(data):
 
 
 def do_dialog(dialog, suffix, load_save_folder):
-    ''' Open a file dialog. '''
+    ''' Open a file dialog. suffix is a single suffix or a tuple of
+    suffixes. '''
     result = None
     file_filter = gtk.FileFilter()
-    file_filter.add_pattern('*' + suffix)
+    if isinstance(suffix, tuple):
+        for s in suffix:
+            file_filter.add_pattern('*' + s)
+    else:
+        file_filter.add_pattern('*' + suffix)
     file_filter.set_name('Turtle Art')
     dialog.add_filter(file_filter)
 
@@ -442,6 +487,7 @@ def do_dialog(dialog, suffix, load_save_folder):
 
 def save_picture(canvas, file_name):
     ''' Save the canvas to a file '''
+    canvas.stroke_path()
     x_surface = canvas.canvas.get_target()
     img_surface = cairo.ImageSurface(cairo.FORMAT_RGB24,
                                      canvas.width, canvas.height)
@@ -456,6 +502,7 @@ def save_picture(canvas, file_name):
 
 def get_canvas_data(canvas):
     ''' Get pixel data from the turtle canvas '''
+    canvas.stroke_path()
     x_surface = canvas.canvas.get_target()
     img_surface = cairo.ImageSurface(cairo.FORMAT_RGB24,
                                      canvas.width, canvas.height)
@@ -494,30 +541,72 @@ def get_path(activity, subpath):
                             'org.laptop.TurtleArtActivity', subpath))
 
 
-def image_to_base64(image_path, tmp_path):
+def image_to_base64(image_path, tmp_path=None):
     ''' Convert an image to base64-encoded data '''
-    base64 = os.path.join(tmp_path, 'base64tmp')
-    cmd = 'base64 <' + image_path + ' >' + base64
-    subprocess.check_call(cmd, shell=True)
-    file_handle = open(base64, 'r')
+    file_handle = open(image_path, 'rb')
     data = file_handle.read()
     file_handle.close()
-    os.remove(base64)
-    return data
+    return base64.b64encode(data)
 
 
 def base64_to_image(data, path_name):
     ''' Convert base64-encoded data to an image '''
-    base64 = os.path.join(path_name, 'base64tmp')
-    file_handle = open(base64, 'w')
-    file_handle.write(data)
-    file_handle.close()
     file_name = os.path.join(path_name, 'imagetmp.png')
-    cmd = 'base64 -d <' + base64 + '>' + file_name
-    subprocess.check_call(cmd, shell=True)
+    file_handle = open(file_name, 'wb')
+    file_handle.write(base64.b64decode(data))
+    file_handle.close()
     return file_name
 
 
+# Images shared with the other turtles in a session, most recent last: the
+# same image is often stamped many times over.
+_BASE64_CACHE_SIZE = 8
+_base64_cache = OrderedDict()  # pixbuf content digest: base64 PNG data
+_pixbuf_cache = OrderedDict()  # (data digest, width, height): pixbuf
+
+
+def _cache_get(cache, key):
+    value = cache.pop(key, None)
+    if value is not None:
+        cache[key] = value
+    return value
+
+
+def _cache_add(cache, key, value):
+    cache[key] = value
+    while len(cache) > _BASE64_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def pixbuf_to_base64(pixbuf):
+    ''' Convert a pixbuf to base64-encoded PNG data '''
+    digest = hashlib.sha1(pixbuf.get_pixels())
+    digest.update(str((pixbuf.get_width(), pixbuf.get_height(),
+                       pixbuf.get_rowstride(), pixbuf.get_has_alpha())))
+    key = digest.digest()
+    data = _cache_get(_base64_cache, key)
+    if data is None:
+        png = StringIO()
+        pixbuf.save_to_callback(png.write, 'png', {'quality': '100'})
+        data = base64.b64encode(png.getvalue())
+        _cache_add(_base64_cache, key, data)
+    return data
+
+
+def base64_to_pixbuf(data, width, height):
+    ''' Convert base64-encoded image data to a pixbuf of the given size '''
+    key = (hashlib.sha1(data).digest(), width, height)
+    pixbuf = _cache_get(_pixbuf_cache, key)
+    if pixbuf is None:
+        loader = gtk.gdk.PixbufLoader()
+        loader.set_size(width, height)
+        loader.write(base64.b64decode(data))
+        loader.close()
+        pixbuf = loader.get_pixbuf()
+        _cache_add(_pixbuf_cache, key, pixbuf)
+    return pixbuf
+
+
 def movie_media_type(name):
     ''' Is it movie media? '''
     guess = mimetypes.guess_type(name)
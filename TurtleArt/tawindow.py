@@ -31,6 +31,7 @@ import pangocairo
 import cairo
 
 import sys
+import time
 from gettext import gettext as _
 
 try:
@@ -45,7 +46,7 @@ import subprocess
 import errno
 
 from random import uniform
-from math import atan2, pi
+from math import atan2, pi, sqrt
 DEGTOR = 2 * pi / 360
 
 import locale
@@ -108,9 +109,10 @@ from .talogo import (LogoCode, logoerror)
 from .tacanvas import TurtleGraphics
 from .tablock import (Blocks, Block, Media, media_blocks_dictionary)
 from .taturtle import (Turtles, Turtle)
-from .tautils import (magnitude, get_load_name, get_save_name, data_from_file,
-                      data_to_file, round_int, get_id, get_pixbuf_from_journal,
-                      movie_media_type, audio_media_type, image_media_type,
+from .tautils import (magnitude, get_load_name, get_save_name,
+                      iter_data_from_file, data_to_file, round_int, get_id,
+                      get_pixbuf_from_journal, movie_media_type,
+                      audio_media_type, image_media_type,
                       save_picture, calc_image_size, get_path, hide_button_hit,
                       show_button_hit, chooser_dialog, arithmetic_check, xy,
                       find_block_to_run, find_top_block, journal_check,
@@ -124,6 +126,7 @@ from .tapalette import block_primitives
 from .tapaletteview import PaletteView
 from .taselector import (Selector, create_toolbar_background)
 from .sprites import (Sprites, Sprite)
+from .tashapecache import shape_cache
 
 from util.menubuilder import make_checkmenu_item
 
@@ -138,6 +141,9 @@ _MARGIN = 5
 _UNFULLSCREEN_VISIBILITY_TIMEOUT = 2
 _PLUGIN_SUBPATH = 'plugins'
 _MACROS_SUBPATH = 'macros'
+_SHAPES_SUBPATH = 'shapes'
+# Steps of process_data, in order, as reported in load_timings
+_LOAD_PHASES = ('create', 'connect', 'layout', 'resize', 'shapes', 'total')
 
 # the global instances of single-instance classes
 global_objects = {}
@@ -151,15 +157,17 @@ class TurtleArtWindow():
     def __init__(self, canvas_window, lib_path, share_path, parent=None,
                  activity=None, mycolors=None, mynick=None,
                  turtle_canvas=None, running_sugar=True,
-                 running_turtleart=True):
+                 running_turtleart=True, canvas_size=None):
         '''
         parent: the GTK Window that TA runs in
         activity: the object that instantiated this TurtleArtWindow (in
                   GNOME, a TurtleMain instance, in Sugar, the Activity
                   instance)
         running_turtleart: are we running TA or exported python code?
+        canvas_size: (width, height) to use instead of the screen size
         '''
         self.parent = parent
+        self._canvas_size = canvas_size
         self.turtle_canvas = turtle_canvas
         self._loaded_project = ''
         self._sharing = False
@@ -206,14 +214,21 @@ class TurtleArtWindow():
         self.py_load_save_folder = os.path.join(self.share_path, 'pysamples')
         self.images_path = os.path.join(self.share_path, 'images')
 
+        # Keep rendered block shapes for the next start
+        if self.running_sugar:
+            shape_cache.set_path(os.path.join(get_path(self.activity, 'data'),
+                                              _SHAPES_SUBPATH))
+        elif hasattr(self.activity, 'get_config_home'):
+            shape_cache.set_path(os.path.join(
+                self.activity.get_config_home(), _SHAPES_SUBPATH))
+
         self._py_cache = {}
         self.used_block_list = []  # Which blocks has the user used?
         self.save_folder = None
         self.save_file_name = None
 
         # dimensions
-        self.width = gtk.gdk.screen_width()
-        self.height = gtk.gdk.screen_height()
+        self.width, self.height = self._get_screen_size()
         self.rect = gtk.gdk.Rectangle(0, 0, 0, 0)
 
         self.no_help = False
@@ -268,6 +283,8 @@ class TurtleArtWindow():
         self.nop = 'nop'
         self.loaded = 0
         self.step_time = 0
+        self.load_timings = {}  # seconds spent in each step of process_data
+        self.report_load_timings = False  # print them after each load
         # show/ hide palettes depending on whether we're running in TA or not
         self.hide = not self.running_turtleart
         self.palette = self.running_turtleart
@@ -309,9 +326,11 @@ class TurtleArtWindow():
 
         # common properties of all blocks (font size, decimal point, ...)
         self.block_list = Blocks(font_scale_factor=self.scale,
-                                 decimal_point=self.decimal_point)
+                                 decimal_point=self.decimal_point,
+                                 dock_cell_size=_SNAP_THRESHOLD)
         if self.interactive_mode:
             self.sprite_list = Sprites(self.window)
+            self.sprite_list.update_cb = self.block_list.sprite_updated
         else:
             self.sprite_list = None
 
@@ -743,10 +762,15 @@ class TurtleArtWindow():
                                                CONSTANTS[blk.name]))
                 blk.resize()
 
+    def _get_screen_size(self):
+        ''' Screen size, unless a fixed canvas size was requested '''
+        if self._canvas_size is not None:
+            return self._canvas_size
+        return gtk.gdk.screen_width(), gtk.gdk.screen_height()
+
     def _configure_cb(self, event):
         ''' Screen size has changed '''
-        self.width = gtk.gdk.screen_width()
-        self.height = gtk.gdk.screen_height()
+        self.width, self.height = self._get_screen_size()
         self.recalculate_constants()
 
         if event is None:
@@ -784,8 +808,11 @@ class TurtleArtWindow():
             cr.set_source_surface(self.turtle_canvas)
             cr.paint()
 
-        # Refresh sprite list
-        self.sprite_list.redraw_sprites(cr=cr)
+        # Refresh the sprites in the exposed area
+        if event is None:
+            self.sprite_list.redraw_sprites(cr=cr, area=self.rect)
+        else:
+            self.sprite_list.redraw_sprites(cr=cr, area=event.area)
 
     def eraser_button(self):
         ''' Eraser_button (hide status block when clearing the screen.) '''
@@ -826,6 +853,8 @@ class TurtleArtWindow():
                 return
 
         # If there is no 'start' block, run stacks that aren't 'def action'
+        # at the same time
+        concurrent = False
         for blk in self.just_blocks():
             if find_block_to_run(blk):
                 self.step_time = time
@@ -836,7 +865,8 @@ class TurtleArtWindow():
                     self.selected_blk = None
                 else:
                     self.selected_blk = blk
-                self._run_stack(blk)
+                self._run_stack(blk, concurrent)
+                concurrent = True
         return
 
     def stop_button(self):
@@ -898,15 +928,14 @@ class TurtleArtWindow():
         ''' Reposition the overlays when window size changes '''
         # self.width = event.width
         # self.height = event.height
-        self.width = gtk.gdk.screen_width()
-        self.height = gtk.gdk.screen_height()
+        self.width, self.height = self._get_screen_size()
 
         for name in OVERLAY_SHAPES:
             if not name in self.overlay_shapes:
                 continue
             shape = self.overlay_shapes[name]
             showing = False
-            if shape in shape._sprites.list:
+            if shape._sprites.find_in_list(shape):
                 shape.hide()
                 showing = True
             self.overlay_shapes[name].move((int(self.width / 2 - 600),
@@ -956,6 +985,11 @@ class TurtleArtWindow():
         if self.interactive_mode:
             self.window.queue_draw_area(0, 0, self.width, self.height)
 
+    def inval_area(self, x, y, w, h):
+        ''' Force a refresh of part of the window '''
+        if self.interactive_mode:
+            self.window.queue_draw_area(x, y, w, h)
+
     def hideshow_palette(self, state):
         ''' Hide or show palette  '''
         if not state:
@@ -1964,8 +1998,7 @@ class TurtleArtWindow():
                 blk.spr.hide()
                 remove_list.append(blk)
         for blk in remove_list:
-            if blk in self.block_list.list:
-                self.block_list.list.remove(blk)
+            self.block_list.remove_from_list(blk)
         self.trash_stack = []
         if 'trash' in palette_names:
             self.show_toolbar_palette(palette_names.index('trash'),
@@ -2190,7 +2223,33 @@ class TurtleArtWindow():
         self.drag_group = find_group(top)
 
     def process_data(self, block_data, offset=0):
-        ''' Process block_data (from a macro, a file, or the clipboard). '''
+        ''' Process block_data (from a macro, a file, or the clipboard):
+        a list of block records, or an iterator, such as
+        iter_data_from_file, that yields them as they are read. '''
+        starttime = time.time()
+        self.load_timings = {}
+        if self.interactive_mode:
+            # Blocks change shape many times while they are connected and
+            # resized; draw each one only once, at the end.
+            self.block_list.set_defer_shapes(True)
+        try:
+            blk = self._process_data(block_data, offset)
+        finally:
+            if self.interactive_mode:
+                phasetime = time.time()
+                self.block_list.set_defer_shapes(False)
+                self.load_timings['shapes'] = time.time() - phasetime
+        self.load_timings['total'] = time.time() - starttime
+        if self.report_load_timings:
+            debug_output('loaded %d blocks: %s' % (
+                len(self._process_block_data),
+                ', '.join(['%s %.3fs' % (phase, self.load_timings[phase])
+                           for phase in _LOAD_PHASES
+                           if phase in self.load_timings])),
+                self.running_sugar)
+        return blk
+
+    def _process_data(self, block_data, offset):
         if self.interactive_mode:
             self.sprite_list.set_defer_draw(True)
         self._process_block_data = []
@@ -2206,14 +2265,13 @@ class TurtleArtWindow():
                     return None
         self._extra_block_data = []
         # Create the blocks (or turtle).
+        phasetime = time.time()
         blocks = []
         for i, blk in enumerate(self._process_block_data):
             if not (self._found_a_turtle(blk) or self._found_font_scale(blk)):
                 newblk = self.load_block(blk, offset)
                 if newblk is not None:
                     blocks.append(newblk)
-                    if newblk.spr is not None:
-                        newblk.spr.set_layer(TOP_LAYER)
                 else:
                     blocks.append(None)
         # Some extra blocks may have been added by load_block
@@ -2222,10 +2280,15 @@ class TurtleArtWindow():
             newblk = self.load_block(blk, offset)
             if newblk is not None:
                 blocks.append(newblk)
-                if newblk.spr is not None:
-                    newblk.spr.set_layer(TOP_LAYER)
+        # Put the new blocks on top, all at once
+        if self.interactive_mode:
+            self.sprite_list.set_layers(
+                [blk.spr for blk in blocks
+                 if blk is not None and blk.spr is not None], TOP_LAYER)
+        self.load_timings['create'] = time.time() - phasetime
 
         # Make the connections.
+        phasetime = time.time()
         for i, blk in enumerate(blocks):
             if blk is None:
                 continue
@@ -2288,8 +2351,10 @@ class TurtleArtWindow():
                 debug_output('Warning: unknown connection state %s' %
                              (str(blk.connections)), self.running_sugar)
             blk.connections = cons[:]
+        self.load_timings['connect'] = time.time() - phasetime
 
         # Block sizes and shapes may have changed.
+        phasetime = time.time()
         for blk in blocks:
             if blk is None:
                 continue
@@ -2350,10 +2415,13 @@ class TurtleArtWindow():
             if blk is not None:
                 blocks_copy.append(blk)
         blocks = blocks_copy[:]
+        self.load_timings['layout'] = time.time() - phasetime
 
         # Resize blocks to current scale and draw
+        phasetime = time.time()
         if self.interactive_mode:
             self.resize_blocks(blocks)
+        self.load_timings['resize'] = time.time() - phasetime
 
         if self.interactive_mode:
             self.sprite_list.set_defer_draw(False)
@@ -2527,8 +2595,7 @@ class TurtleArtWindow():
                     miny = blk.spr.rect.y
                 if blk.spr.rect.y + blk.spr.rect.height > maxy:
                     maxy = blk.spr.rect.y + blk.spr.rect.height
-                blk.spr.rect.x += dx
-                blk.spr.rect.y += dy
+                blk.spr.move_relative((dx, dy), invalidate=False)
 
             if dx < 0:
                 minx += dx
@@ -3004,8 +3071,9 @@ class TurtleArtWindow():
             else:
                 break
 
-    def _run_stack(self, blk):
-        ''' Run a stack of blocks. '''
+    def _run_stack(self, blk, concurrent=False):
+        ''' Run a stack of blocks (alongside the stacks already running if
+        concurrent). '''
         if not self.interactive_mode:
             # Test for forever block
             if len(self.block_list.get_similar_blocks('block', 'forever')) > 0:
@@ -3015,16 +3083,16 @@ class TurtleArtWindow():
             self._hide_text_entry()
             self.parent.get_window().set_cursor(
                 gtk.gdk.Cursor(gtk.gdk.WATCH))
-        gobject.idle_add(self.__run_stack, blk)
+        gobject.idle_add(self.__run_stack, blk, concurrent)
 
-    def __run_stack(self, blk):
+    def __run_stack(self, blk, concurrent=False):
         if self.status_spr is not None:
             self.status_spr.hide()
         self._autohide_shape = True
         if blk is None:
             return
         self.lc.find_value_blocks()  # Are there blocks to update?
-        if self.canvas.cr_svg is None:
+        if self.canvas.display_list is None:
             self.canvas.setup_svg_surface()
         self.running_blocks = True
         self.start_plugins()  # Let the plugins know we are running.
@@ -3033,12 +3101,13 @@ class TurtleArtWindow():
         if self.interactive_mode:
             self.parent.get_window().set_cursor(
                 gtk.gdk.Cursor(gtk.gdk.LEFT_PTR))
-        self.lc.run_blocks(code)
+        if not self.lc.run_blocks(code, concurrent=concurrent):
+            return  # Too many stacks running already
         if self.interactive_mode:
-            gobject.idle_add(self.lc.doevalstep)
+            self.lc.start_stepping()
         else:
             while self.lc.doevalstep():
-                pass
+                self.lc.sleep_until_resume()
         # self.running_blocks = False  # Should be handled in talogo.py
 
     def _snap_to_dock(self):
@@ -3048,26 +3117,33 @@ class TurtleArtWindow():
         best_destination = None
         d = _SNAP_THRESHOLD
         self.inserting_block_mid_stack = False
+        # magnitude is the square of the distance between the docks
+        distance = sqrt(_SNAP_THRESHOLD)
+        (sx, sy) = selected_block.spr.get_xy()
         for selected_block_dockn in range(len(selected_block.docks)):
-            for destination_block in self.just_blocks():
+            dock = selected_block.docks[selected_block_dockn]
+            # Only check the docks close enough for a connection
+            for destination_block, destination_dockn in \
+                    self.block_list.find_docks(sx + dock[2], sy + dock[3],
+                                               distance):
+                if destination_block.type != 'block':
+                    continue
                 # Don't link to a block that is hidden
                 if destination_block.status == 'collapsed':
                     continue
                 # Don't link to a block to which you're already connected
                 if destination_block in self.drag_group:
                     continue
-                # Check each dock of destination for a possible connection
-                for destination_dockn in range(len(destination_block.docks)):
-                    this_xy = self.dock_dx_dy(
-                        destination_block, destination_dockn,
-                        selected_block, selected_block_dockn)
-                    if magnitude(this_xy) > d:
-                        continue
-                    d = magnitude(this_xy)
-                    best_xy = this_xy
-                    best_destination = destination_block
-                    best_destination_dockn = destination_dockn
-                    best_selected_block_dockn = selected_block_dockn
+                this_xy = self.dock_dx_dy(
+                    destination_block, destination_dockn,
+                    selected_block, selected_block_dockn)
+                if magnitude(this_xy) > d:
+                    continue
+                d = magnitude(this_xy)
+                best_xy = this_xy
+                best_destination = destination_block
+                best_destination_dockn = destination_dockn
+                best_selected_block_dockn = selected_block_dockn
         if d < _SNAP_THRESHOLD:
             # Some combinations of blocks are not valid
             if not arithmetic_check(selected_block, best_destination,
@@ -3841,7 +3917,7 @@ class TurtleArtWindow():
                 # add a new block for this code at turtle position
                 pos = self.turtles.get_active_turtle().get_xy()
                 self._new_block('userdefined', pos[0], pos[1])
-                self.myblock[self.block_list.list.index(self.drag_group[0])] =\
+                self.myblock[self.block_list.get_index(self.drag_group[0])] =\
                     self.python_code
                 self.set_userdefined(self.drag_group[0])
                 self.drag_group[0].values.append(id)
@@ -3890,7 +3966,7 @@ class TurtleArtWindow():
             self.load_python_code_from_file(fname=None, add_new_block=False)
 
         if self.selected_blk is not None:
-            self.myblock[self.block_list.list.index(self.selected_blk)] = \
+            self.myblock[self.block_list.get_index(self.selected_blk)] = \
                 self.python_code
             self.set_userdefined(self.selected_blk)
 
@@ -3927,13 +4003,13 @@ class TurtleArtWindow():
         ''' Load a project from a file '''
         if create_new_project:
             self.new_project()
-        self.process_data(data_from_file(ta_file))
+        self.process_data(iter_data_from_file(ta_file))
         self._loaded_project = ta_file
 
     def load_file_from_chooser(self, create_new_project=True):
         ''' Load a project from file chooser '''
         file_name, self.load_save_folder = get_load_name(
-            '.t[a-b]',
+            SUFFIX,
             self.load_save_folder)
         if file_name is None:
             return
@@ -4143,7 +4219,7 @@ class TurtleArtWindow():
                                                     add_new_block=False)
                     self.selected_blk = None
                 if self.python_code is not None:
-                    self.myblock[self.block_list.list.index(blk)] = \
+                    self.myblock[self.block_list.get_index(blk)] = \
                         self.python_code
                     self.set_userdefined(blk)
         if btype == 'string' and blk.spr is not None:
@@ -4237,8 +4313,6 @@ class TurtleArtWindow():
                 else:
                     self._block_skin('pythonoff', blk)
 
-        if self.interactive_mode:
-            blk.spr.set_layer(BLOCK_LAYER)
         if check_dock:
             blk.connections = 'check'
 
@@ -4267,7 +4341,7 @@ class TurtleArtWindow():
                   self.toolbar_offset + PALETTE_HEIGHT + 20 + ICON_SIZE,
                   [None, None]]])
         else:
-            self.process_data(data_from_file(ta_file))
+            self.process_data(iter_data_from_file(ta_file))
             self._loaded_project = ta_file
 
     def save_file(self, file_name=None):
@@ -4276,7 +4350,7 @@ class TurtleArtWindow():
             self.load_save_folder = self.save_folder
         if file_name is None:
             file_name, self.load_save_folder = get_save_name(
-                '.t[a-b]', self.load_save_folder, self.save_file_name)
+                SUFFIX[1:], self.load_save_folder, self.save_file_name)
         if not is_writeable(self.load_save_folder):
             if self.running_sugar:  # Shouldn't occur in Sugar
                 debug_output('Cannot write data to %s.' %
@@ -4770,7 +4844,7 @@ class TurtleArtWindow():
 
         file_path = os.path.join(datapath, filename)
         if svg:
-            if self.canvas.cr_svg is None:
+            if self.canvas.display_list is None:
                 return
             self.canvas.svg_close()
             self.canvas.svg_reset()
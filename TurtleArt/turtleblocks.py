@@ -55,7 +55,8 @@ from TurtleArt.taconstants import (OVERLAY_LAYER, DEFAULT_TURTLE_COLORS,
                                    TAB_LAYER, SUFFIX, TMP_SVG_PATH,
                                    TMP_ODP_PATH, PASTE_OFFSET)
 from TurtleArt.tautils import (data_from_string, get_load_name,
-                               get_path, get_save_name, is_writeable)
+                               get_path, get_save_name, is_writeable,
+                               debug_output)
 from TurtleArt.tapalette import default_values
 from TurtleArt.tawindow import TurtleArtWindow
 from TurtleArt.taexportlogo import save_logo
@@ -109,7 +110,11 @@ class TurtleMain():
  \tturtleblocks.py --output_png project.tb
  \tturtleblocks.py -o project
  \tturtleblocks.py --run project.tb
- \tturtleblocks.py -r project'''
+ \tturtleblocks.py -r project
+ \tturtleblocks.py --timings project.tb
+ \tturtleblocks.py -t project
+ \tturtleblocks.py --fps=30 project.tb
+ \tturtleblocks.py -f 30 project'''
         self._init_vars()
         self._parse_command_line()
         self._ensure_sugar_paths()
@@ -216,6 +221,8 @@ return %s(self)" % (p, P, P)
     def _draw_and_quit(self):
         ''' Non-interactive mode: run the project, save it to a file
         and quit. '''
+        # Only a PNG is saved, so there is no need to record an SVG
+        self.tw.canvas.svg_recording = False
         self.tw.load_start(self._ta_file)
         self.tw.lc.trace = 0
         self.tw.run_button(0)
@@ -249,6 +256,8 @@ return %s(self)" % (p, P, P)
                                   turtle_canvas=self.turtle_canvas,
                                   activity=self, running_sugar=False)
         self.tw.save_folder = self._abspath  # os.path.expanduser('~')
+        self.tw.report_load_timings = self._report_timings
+        self.tw.canvas.fps = self._fps
 
         if hasattr(self, 'client'):
             if self.client.get_int(self._HOVER_HELP) == 1:
@@ -280,6 +289,8 @@ return %s(self)" % (p, P, P)
         self._ta_file = None
         self._output_png = False
         self._run_on_launch = False
+        self._report_timings = False
+        self._fps = 0
         self.current_palette = 0
         self.scale = 2.0
         self.tw = None
@@ -288,8 +299,9 @@ return %s(self)" % (p, P, P)
     def _parse_command_line(self):
         ''' Try to make sense of the command-line arguments. '''
         try:
-            opts, args = getopt.getopt(argv[1:], 'hor',
-                                       ['help', 'output_png', 'run'])
+            opts, args = getopt.getopt(argv[1:], 'hortf:',
+                                       ['help', 'output_png', 'run',
+                                        'timings', 'fps='])
         except getopt.GetoptError as err:
             print str(err)
             print self._HELP_MSG
@@ -303,6 +315,14 @@ return %s(self)" % (p, P, P)
                 self._output_png = True
             elif o in ('-r', '--run'):
                 self._run_on_launch = True
+            elif o in ('-t', '--timings'):
+                self._report_timings = True
+            elif o in ('-f', '--fps'):
+                try:
+                    self._fps = float(a)
+                except ValueError:
+                    print self._HELP_MSG
+                    sys.exit(2)
             else:
                 assert False, _('No option action:') + ' ' + o
         if args:
@@ -505,8 +525,13 @@ return %s(self)" % (p, P, P)
         make_menu_item(menu, _('Clean'), self._do_eraser_cb)
         make_menu_item(menu, _('Run'), self._do_run_cb)
         make_menu_item(menu, _('Step'), self._do_step_cb)
+        make_menu_item(menu, _('Turbo'), self._do_turbo_cb)
         make_menu_item(menu, _('Debug'), self._do_trace_cb)
         make_menu_item(menu, _('Stop'), self._do_stop_cb)
+        make_checkmenu_item(menu, _('Profile'), self._do_profile_cb,
+                            status=False)
+        make_checkmenu_item(menu, _('Compiled'), self._do_compiled_cb,
+                            status=False)
         turtle_menu = make_sub_menu(menu, _('Turtle'))
 
         self._plugin_menu = gtk.Menu()
@@ -855,6 +880,7 @@ Would you like to save before quitting?'))
     def _do_run_cb(self, widget=None):
         ''' Callback for run button (rabbit). '''
         self.tw.lc.trace = 0
+        self.tw.lc.turbo = False
         self.tw.hideblocks()
         self.tw.display_coordinates(clear=True)
         self.tw.toolbar_shapes['stopiton'].set_layer(TAB_LAYER)
@@ -864,15 +890,44 @@ Would you like to save before quitting?'))
     def _do_step_cb(self, widget):
         ''' Callback for step button (turtle). '''
         self.tw.lc.trace = 1
+        self.tw.lc.turbo = False
         self.tw.run_button(3, running_from_button_push=True)
         return
 
+    def _do_turbo_cb(self, widget):
+        ''' Callback for turbo button: run at full speed, blocks and all. '''
+        self.tw.lc.trace = 0
+        self.tw.lc.turbo = True
+        self.tw.display_coordinates(clear=True)
+        self.tw.toolbar_shapes['stopiton'].set_layer(TAB_LAYER)
+        self.tw.run_button(0, running_from_button_push=True)
+        return
+
     def _do_trace_cb(self, widget):
         ''' Callback for debug button (bug). '''
         self.tw.lc.trace = 1
+        self.tw.lc.turbo = False
         self.tw.run_button(9, running_from_button_push=True)
         return
 
+    def _do_compiled_cb(self, widget):
+        ''' Callback for compiled check box: Run, Step and Turbo run the
+        blocks as a flat list of instructions. '''
+        self.tw.lc.compiled = widget.get_active()
+
+    def _do_profile_cb(self, widget):
+        ''' Callback for profile check box: start recording block times;
+        when turned off, output the report and color the hot blocks. '''
+        if widget.get_active():
+            self.tw.lc.hide_profile_heat_map()
+            self.tw.lc.reset_profile()
+            self.tw.lc.profiling = True
+        else:
+            self.tw.lc.profiling = False
+            debug_output(self.tw.lc.get_profile_report(),
+                         self.tw.running_sugar)
+            self.tw.lc.show_profile_heat_map()
+
     def _do_stop_cb(self, widget):
         ''' Callback for stop button. '''
         if self.tw.running_blocks:
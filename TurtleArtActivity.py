@@ -502,7 +502,9 @@ class TurtleArtActivity(activity.Activity):
         ''' Callback for run button (rabbit) '''
         self.run_button.set_icon('run-faston')
         self.step_button.set_icon('run-slowoff')
+        self.turbo_button.set_icon('run-turbooff')
         self.tw.lc.trace = 0
+        self.tw.lc.turbo = False
         self.tw.step_time = 0
         # Autohide blocks and palettes on run
         self.tw.hideblocks()
@@ -513,10 +515,23 @@ class TurtleArtActivity(activity.Activity):
         ''' Callback for step button (turtle) '''
         self.step_button.set_icon('run-slowon')
         self.run_button.set_icon('run-fastoff')
+        self.turbo_button.set_icon('run-turbooff')
         self.tw.lc.trace = 1
+        self.tw.lc.turbo = False
         self.tw.step_time = 3
         self.tw.run_button(self.tw.step_time, running_from_button_push=True)
 
+    def do_turbo_cb(self, button):
+        ''' Callback for turbo button: run at full speed, blocks and all '''
+        self.turbo_button.set_icon('run-turboon')
+        self.run_button.set_icon('run-fastoff')
+        self.step_button.set_icon('run-slowoff')
+        self.tw.lc.trace = 0
+        self.tw.lc.turbo = True
+        self.tw.step_time = 0
+        self.tw.display_coordinates(clear=True)
+        self.tw.run_button(self.tw.step_time, running_from_button_push=True)
+
     def do_stop_cb(self, button):
         ''' Callback for stop button. '''
         # Auto show blocks after stop
@@ -876,6 +891,7 @@ class TurtleArtActivity(activity.Activity):
         add_paragraph(help_box, _('Clean'), icon='eraseron')
         add_paragraph(help_box, _('Run'), icon='run-fastoff')
         add_paragraph(help_box, _('Step'), icon='run-slowoff')
+        add_paragraph(help_box, _('Turbo'), icon='run-turbooff')
         add_paragraph(help_box, _('Stop turtle'), icon='stopitoff')
         add_paragraph(help_box, _('Show blocks'), icon='hideshowoff')
         add_paragraph(help_box, _('Load example'), icon='ta-open')
@@ -967,7 +983,7 @@ class TurtleArtActivity(activity.Activity):
 
     def _save_as_icon_expose_cb(self, box, context):
         for widget in box.get_children():
-            widget.set_sensitive(self.tw.canvas.cr_svg is not None)
+            widget.set_sensitive(self.tw.canvas.display_list is not None)
 
     def _save_as_odp_expose_cb(self, box, context):
         for widget in box.get_children():
@@ -1188,6 +1204,9 @@ class TurtleArtActivity(activity.Activity):
             'run-fastoff', _('Run'), self.do_run_cb, toolbar, _('<Ctrl>r'))
         self.step_button = self._add_button(
             'run-slowoff', _('Step'), self.do_step_cb, toolbar, _('<Ctrl>w'))
+        self.turbo_button = self._add_button(
+            'run-turbooff', _('Turbo'), self.do_turbo_cb, toolbar,
+            _('<Ctrl>t'))
         self.stop_turtle_button = self._add_button(
             'hideshowoff', _('Hide blocks'), self.do_stop_cb, toolbar,
             _('<Ctrl>s'))
@@ -77,7 +77,7 @@ if len(sys.argv) > 1 and '--no-sugar' == sys.argv[1]:
           author_email="walter.bender@gmail.com",
           version='0.9.4',
           packages=['TurtleArt', 'TurtleArt.util'],
-          scripts=['turtleblocks'],
+          scripts=['turtleblocks', 'turtleblocks-batch'],
           data_files=DATA_FILES,
           cmdclass={"install": post_install}
           )
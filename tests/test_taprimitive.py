@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' Tests for the Primitive argument fast path (run with python -m unittest
+discover -s tests from the top directory) '''
+
+import unittest
+
+from TurtleArt import tatype
+from TurtleArt.taprimitive import ArgSlot, ConstantArg, Primitive
+from TurtleArt.tatype import (TATypeError, TYPE_INT, TYPE_NUMBER,
+                              TYPE_STRING, update_converters)
+
+_ARGUMENTS = [
+    (2, 3),
+    (2.5, -1),
+    (2, 3.0),
+    ('2', '3'),
+    ('2.5', 4),
+    ('hello', 'world'),
+    ('hello', 4),
+    (u'caf\xe9', '1'),
+    (True, 2)]
+
+
+def _plus(return_type):
+    ''' One of the Primitives that make up the 'plus' block in tabasics '''
+    return Primitive(Primitive.plus, return_type=return_type,
+                     arg_descs=[ArgSlot(return_type), ArgSlot(return_type)])
+
+
+def _primitives():
+    return [_plus(TYPE_NUMBER),
+            _plus(TYPE_STRING),
+            Primitive(Primitive.random_int, return_type=TYPE_INT,
+                      arg_descs=[ArgSlot(TYPE_INT), ArgSlot(TYPE_INT)]),
+            Primitive(Primitive.plus, return_type=TYPE_NUMBER,
+                      arg_descs=[ConstantArg(10), ArgSlot(TYPE_NUMBER)])]
+
+
+def _fill_slots(prim, arguments):
+    ''' What Primitive.__call__ did before the fast path, or the error it
+    raised '''
+    try:
+        new_prim = prim.fill_slots(arguments, convert_to_ast=False)
+    except TATypeError as error:
+        return error.__class__
+    return new_prim.get_values_of_filled_slots()
+
+
+def _dispatch(prim, arguments):
+    try:
+        return prim._dispatch(arguments)
+    except TATypeError as error:
+        return error.__class__
+
+
+class DispatchTestCase(unittest.TestCase):
+
+    def _check(self, prim, arguments):
+        values = _dispatch(prim, arguments)
+        if values is not None:
+            # the second time round the cached plan is used
+            self.assertEqual(_dispatch(prim, arguments), values)
+            self.assertEqual(values, _fill_slots(prim, arguments),
+                             '%r%r' % (prim, arguments))
+
+    def test_same_as_fill_slots(self):
+        for prim in _primitives():
+            for arguments in _ARGUMENTS:
+                if len(prim.arg_descs) == 2:
+                    self._check(prim, arguments)
+                else:
+                    self._check(prim, arguments[1:])
+
+    def test_fast_path_is_used(self):
+        prim = _plus(TYPE_NUMBER)
+        self.assertEqual(prim._dispatch((2, 3.5)), ([2, 3.5], {}))
+        for arguments in _ARGUMENTS[:5]:
+            self.assertNotEqual(prim._dispatch(arguments), None, arguments)
+
+    def test_primitive_arguments(self):
+        prim = _plus(TYPE_NUMBER)
+        inner = _plus(TYPE_NUMBER)
+        arguments = ((inner, 1, 2), 4)
+        values = _dispatch(prim, arguments)
+        self.assertEqual(values, ([3, 4], {}))
+        self.assertEqual(values, _fill_slots(prim, arguments))
+
+    def test_wrong_number_of_arguments(self):
+        prim = _plus(TYPE_NUMBER)
+        self.assertEqual(prim._dispatch((1,)), None)
+        self.assertEqual(prim._dispatch((1, 2, 3)), None)
+
+    def test_converters_changed(self):
+        prim = _plus(TYPE_NUMBER)
+        prim._dispatch((1, 2))
+        self.assertTrue(prim._dispatch_cache)
+        update_converters()
+        self.assertEqual(prim._dispatch_generation + 1,
+                         tatype.converter_generation)
+        self.assertEqual(prim._dispatch((1, 2)), ([1, 2], {}))
+        self.assertEqual(prim._dispatch_generation,
+                         tatype.converter_generation)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' Tests for reading and archiving project files (run with python -m
+unittest discover -s tests from the top directory) '''
+
+import base64
+import glob
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from TurtleArt.taconstants import MAGICNUMBER
+from TurtleArt.taproject import (iter_records, load_data, starts_like_json,
+                                 is_archive, write_archive, read_archive,
+                                 ProjectArchive)
+
+_SAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'samples')
+
+
+def _tuplify(value):
+    if not isinstance(value, list):
+        return value
+    return tuple(map(_tuplify, value))
+
+
+def _old_json_load(text):
+    ''' tautils.json_load as it was before taproject, which read the whole
+    text at once '''
+    if text[0:2] == MAGICNUMBER:
+        clean_text = text[2:].lstrip()
+    else:
+        clean_text = text.lstrip()
+    clean_text = clean_text.replace('\12', '')
+    clean_text = clean_text.replace('\00', '')
+    clean_text = clean_text.rstrip()
+    left_count = clean_text.count('[')
+    right_count = clean_text.count(']')
+    while left_count > right_count:
+        clean_text += ']'
+        right_count = clean_text.count(']')
+    return _tuplify(json.load(StringIO(clean_text)))
+
+
+class _CountingFile(StringIO):
+    ''' A file that remembers how much has been read from it '''
+
+    def __init__(self, text):
+        StringIO.__init__(self, text)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = StringIO.read(self, size)
+        self.bytes_read += len(data)
+        return data
+
+
+class LoadDataTestCase(unittest.TestCase):
+
+    def test_samples_match_old_loader(self):
+        samples = glob.glob(os.path.join(_SAMPLES, '*.t[ab]'))
+        self.assertTrue(samples)
+        for path in samples:
+            text = open(path, 'rb').read()
+            self.assertEqual(load_data(StringIO(text)), _old_json_load(text),
+                             path)
+
+    def test_magic_number(self):
+        text = '[[0, "start", 0, 0, [null, null]]]'
+        self.assertEqual(load_data(StringIO(MAGICNUMBER + '\n' + text)),
+                         load_data(StringIO(text)))
+        self.assertTrue(starts_like_json(StringIO(MAGICNUMBER + text)))
+
+    def test_null_padding(self):
+        text = '[[0, "start", 0, 0, [null, 1]],\n' \
+               '[1, ["number", 100], 0, 0, [0, null]]]'
+        self.assertEqual(load_data(StringIO(text + '\0' * 4096)),
+                         load_data(StringIO(text)))
+
+    def test_truncated_record(self):
+        text = '[[0, "start", 0, 0, [null, 1]],\n' \
+               '[1, ["string", "hello'
+        self.assertEqual(load_data(StringIO(text)),
+                         ((0, 'start', 0, 0, (None, 1)),
+                          (1, ('string', 'hello'))))
+
+    def test_truncated_between_records(self):
+        text = '[[0, "start", 0, 0, [null, null]],\n'
+        self.assertEqual(load_data(StringIO(text)),
+                         ((0, 'start', 0, 0, (None, None)),))
+
+    def test_not_a_list(self):
+        self.assertEqual(load_data(StringIO('{"a": [1, 2]}')),
+                         {'a': [1, 2]})
+        self.assertRaises(ValueError, iter_records, StringIO('{"a": 1}'))
+        self.assertFalse(starts_like_json(StringIO('(lp0\n')))
+
+    def test_records_are_read_as_needed(self):
+        record = '[%d, ["string", "' + 'x' * 1000 + '"], 0, 0, [null]]'
+        text = '[' + ',\n'.join([record % i for i in range(1000)]) + ']'
+        f = _CountingFile(text)
+        records = iter_records(f)
+        self.assertEqual(next(records)[0], 0)
+        self.assertTrue(f.bytes_read < len(text) / 2)
+        self.assertEqual(len(list(records)), 999)
+
+
+class ArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # Not valid PNG data, but any bytes will do
+        self.image = 'data:image/png;base64,' + \
+            base64.b64encode(''.join([chr(i % 256) for i in range(6000)]))
+        self.text = u'caf\xe9 ' * 400
+        self.data = (
+            (0, ('media', self.image), 10, 20, (None, None)),
+            (1, ('string', self.text), 30, 40, (None, None)),
+            (2, ('media', self.image), 50, 60, (None, {'a': [1, 2]})),
+            (-1, 'turtle', 0, 0, 0, 0, 50, 5))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, data):
+        path = os.path.join(self.tmp, 'project.tbz')
+        f = open(path, 'wb')
+        write_archive(data, f)
+        f.close()
+        return path
+
+    def test_round_trip(self):
+        path = self._write(self.data)
+        f = open(path, 'rb')
+        self.assertTrue(is_archive(f))
+        self.assertEqual(read_archive(f), self.data)
+        f.close()
+
+    def test_round_trip_samples(self):
+        for sample in glob.glob(os.path.join(_SAMPLES, '*.t[ab]'))[:10]:
+            data = load_data(open(sample, 'rb'))
+            f = open(self._write(data), 'rb')
+            self.assertEqual(read_archive(f), data, sample)
+            f.close()
+
+    def test_assets_stored_once(self):
+        path = self._write(self.data)
+        once = os.path.getsize(path)
+        # The image is stored as bytes, not base64, and only once
+        self.assertTrue(once < len(self.image))
+        archive = ProjectArchive(open(path, 'rb'))
+        self.assertEqual(len(archive._asset_index), 2)
+        archive.close()
+
+    def test_assets_read_when_needed(self):
+        archive = ProjectArchive(open(self._write(self.data), 'rb'))
+        records = archive.records()
+        self.assertEqual(archive._assets, {})
+        self.assertEqual(next(records), self.data[0])
+        self.assertEqual(len(archive._assets), 1)
+        self.assertEqual(tuple(records), self.data[1:])
+        archive.close()
+
+    def test_from_string(self):
+        f = StringIO()
+        write_archive(self.data, f)
+        f.seek(0)
+        self.assertEqual(read_archive(f), self.data)
+
+    def test_newer_version_rejected(self):
+        f = StringIO()
+        write_archive(self.data, f)
+        text = f.getvalue()
+        (version,) = struct.unpack('>H', text[4:6])
+        f = StringIO(text[:4] + struct.pack('>H', version + 1) + text[6:])
+        self.assertRaises(ValueError, read_archive, f)
+
+    def test_not_an_archive(self):
+        self.assertFalse(is_archive(StringIO('[[0, "start"]]')))
+        self.assertRaises(ValueError, read_archive, StringIO('[[0]]'))
+        self.assertRaises(ValueError, read_archive, StringIO(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Sugar Labs
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+''' Tests for the precomputed type converters (run with python -m unittest
+discover -s tests from the top directory) '''
+
+import unittest
+
+from TurtleArt import tatype
+from TurtleArt.tatype import (Type, TYPE_CONVERTERS, TYPE_INT, TYPE_STRING,
+                              get_converter, identity, register_converter,
+                              update_converters)
+
+
+def _old_get_converter(old_type, new_type):
+    ''' get_converter as it was before the chains were precomputed, which
+    searched TYPE_CONVERTERS on every call '''
+    if new_type == tatype.TYPE_OBJECT:
+        return identity
+    if old_type == new_type:
+        return identity
+    return tatype._search_converter(old_type, new_type)
+
+
+def _all_types():
+    return [value for (name, value) in sorted(vars(tatype).items())
+            if name.startswith('TYPE_') and isinstance(value, Type)]
+
+
+class ConverterTestCase(unittest.TestCase):
+
+    def test_same_as_search(self):
+        types = _all_types()
+        self.assertTrue(len(types) > 10)
+        for old_type in types:
+            for new_type in types:
+                self.assertEqual(get_converter(old_type, new_type),
+                                 _old_get_converter(old_type, new_type),
+                                 '%s -> %s' % (old_type, new_type))
+
+    def test_update_after_change(self):
+        generation = tatype.converter_generation
+        type_test = Type('TYPE_TEST', 99)
+        self.assertEqual(get_converter(type_test, TYPE_STRING), None)
+        try:
+            register_converter(type_test, TYPE_INT, int)
+            self.assertTrue(tatype.converter_generation > generation)
+            self.assertEqual(get_converter(type_test, TYPE_INT), int)
+            for new_type in _all_types() + [type_test]:
+                self.assertEqual(get_converter(type_test, new_type),
+                                 _old_get_converter(type_test, new_type),
+                                 'TYPE_TEST -> %s' % (new_type,))
+            self.assertNotEqual(get_converter(type_test, TYPE_STRING), None)
+        finally:
+            del TYPE_CONVERTERS[type_test]
+            update_converters()
+        self.assertEqual(get_converter(type_test, TYPE_INT), None)
+
+
+if __name__ == '__main__':
+    unittest.main()